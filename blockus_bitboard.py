@@ -0,0 +1,376 @@
+"""
+Bitboard backend for blockus_game.State
+
+Cell (row, col) of a size x size board is bit row*size + col of a python int.
+Each player's claimed cells are kept as one such bitmask, and move generation
+filters the precomputed placements of blockus_placements with a few AND/shift
+operations per pose instead of stacking numpy arrays.
+"""
+import numpy as np
+import blockus_game as bg
+import blockus_placements as bp
+import blockus_zobrist as bz
+from polyomino import all_polyominoes
+
+class BoardMasks(object):
+    def __init__(self, size):
+        self.size = size
+        self.full = (1 << (size*size)) - 1
+        first_col, last_col = 0, 0
+        for row in range(size):
+            first_col |= 1 << (row*size)
+            last_col |= 1 << (row*size + size-1)
+        self.not_first_col = self.full & ~first_col
+        self.not_last_col = self.full & ~last_col
+        # starting corners for players 1 and 2
+        self.starts = {1: 1, 2: 1 << (size*size - 1)}
+
+    def sides(self, cells):
+        # cells that share a side with any of the given cells
+        s = self.size
+        return (
+            ((cells << 1) & self.not_first_col) |
+            ((cells >> 1) & self.not_last_col) |
+            (cells << s) | (cells >> s)) & self.full
+
+    def corners(self, cells):
+        # cells that share a corner with any of the given cells
+        s = self.size
+        return (
+            ((cells << (s+1)) & self.not_first_col) |
+            ((cells << (s-1)) & self.not_last_col) |
+            ((cells >> (s-1)) & self.not_first_col) |
+            ((cells >> (s+1)) & self.not_last_col)) & self.full
+
+_masks = {}
+
+def board_masks(size):
+    # board masks depend only on board size, so they are shared between states
+    if size not in _masks: _masks[size] = BoardMasks(size)
+    return _masks[size]
+
+def to_bits(cells):
+    # boolean numpy array -> bitmask
+    bits = 0
+    for i in np.flatnonzero(cells): bits |= 1 << int(i)
+    return bits
+
+def from_bits(bits, size):
+    # bitmask -> boolean numpy array
+    flat = np.unpackbits(
+        np.frombuffer(bits.to_bytes((size*size + 7) // 8, "little"), dtype=np.uint8),
+        bitorder="little")
+    return flat[:size*size].reshape(size, size).astype(bool)
+
+def bit_indices(bits):
+    # indices of set bits in increasing order
+    indices = []
+    while bits:
+        low = bits & -bits
+        indices.append(low.bit_length() - 1)
+        bits ^= low
+    return indices
+
+class BitboardState(object):
+    # Compact, immutable state with the same interface as blockus_game.State.
+    # Per-player fields are tuples indexed by player - 1:
+    # hand_masks: bit i set when all_polyominoes[i] is in hand
+    # history: persistent linked list (placement id, previous) of plays,
+    #   shared between a state and all of its descendants
+    # cells, forbidden, anchors: bitmasks kept up to date by perform
+    # counts: number of claimed cells
+    # key: Zobrist key of (board, hands, turn), see blockus_zobrist
+    # stuck: bit player - 1 set once that player is known to have no moves,
+    #   which stays true in every descendant
+    __slots__ = ("size", "turn", "hand_masks", "history", "cells", "forbidden", "anchors",
+        "counts", "key", "stuck", "masks", "table", "zobrist", "valid_action_list", "_board")
+
+    def __init__(self, size, turn, hands, plays, board=None):
+        # same arguments as blockus_game.State
+        self.size = size
+        self.turn = turn
+        self.masks = board_masks(size)
+        self.table = bp.get_table(size)
+        self.zobrist = bz.get_keys(size)
+        self.valid_action_list = None
+        self._board = None
+
+        players = sorted(plays.keys())
+        self.hand_masks = tuple(
+            sum(1 << polyomino.index for polyomino in hands[player]) for player in players)
+        history = []
+        for player in players:
+            previous = None
+            for row, col, posed in plays[player]:
+                previous = (self.placement_of(row, col, posed), previous)
+            history.append(previous)
+        self.history = tuple(history)
+
+        if board is None: board = np.zeros((size, size), dtype=np.int64)
+        self.cells = tuple(to_bits(board == player) for player in players)
+        self.counts = tuple(bin(cells).count("1") for cells in self.cells)
+        self.forbidden = tuple(self.forbidden_cells(player) for player in players)
+        self.anchors = tuple(self.anchor_cells(player) for player in players)
+        self.key = bz.zobrist_key(self)
+        self.stuck = 0
+
+    @property
+    def board(self):
+        # numpy board as in blockus_game.State, built on first use
+        if self._board is None:
+            board = np.zeros((self.size, self.size), dtype=np.int64)
+            for player, cells in enumerate(self.cells, 1):
+                board[from_bits(cells, self.size)] = player
+            self._board = board
+        return self._board
+
+    @property
+    def hands(self):
+        return {
+            player: [polyomino for polyomino in all_polyominoes if hand >> polyomino.index & 1]
+            for player, hand in enumerate(self.hand_masks, 1)}
+
+    @property
+    def plays(self):
+        table = self.table
+        plays = {}
+        for player, ids in enumerate(self.play_ids(), 1):
+            plays[player] = [
+                (table.row[k], table.col[k], all_polyominoes[table.piece[k]].poses[table.pose[k]])
+                for k in ids]
+        return plays
+
+    def play_ids(self):
+        # placement ids of each player's plays, in order
+        play_ids = []
+        for previous in self.history:
+            ids = []
+            while previous is not None:
+                k, previous = previous
+                ids.append(k)
+            play_ids.append(tuple(reversed(ids)))
+        return tuple(play_ids)
+
+    def placement_of(self, row, col, posed):
+        # placement id of a (row, col, posed array) play
+        for polyomino in all_polyominoes:
+            for p, pose in enumerate(polyomino.poses):
+                if pose.shape == posed.shape and (pose == posed).all():
+                    return self.table.ids[polyomino.index, p, row, col]
+        raise ValueError("not a polyomino pose: %s" % posed)
+
+    def __reduce__(self):
+        # compact pickled form: only ints, the shared tables are looked up
+        # again by board size when unpickled
+        return (restore_state, (self.size, self.turn, self.hand_masks, self.play_ids(),
+            self.cells, self.forbidden, self.anchors, self.counts, self.key, self.stuck))
+
+    __str__ = bg.State.__str__
+
+    def copy(self):
+        state = object.__new__(BitboardState)
+        for name in BitboardState.__slots__: setattr(state, name, getattr(self, name))
+        return state
+
+    def is_leaf(self):
+        return not any(self.has_any_move(player) for player in range(1, len(self.hand_masks)+1))
+
+    def has_any_move(self, player):
+        # stop at the first legal placement, trying the largest pieces first;
+        # every pose checks all live anchors at once
+        i = player-1
+        if self.stuck >> i & 1: return False
+        if player == self.turn and self.valid_action_list is not None:
+            return self.valid_action_list != [None]
+
+        poses = self.table.poses
+        legal = self.open_cells() & ~self.forbidden[i]
+        anchors, hand = self.anchors[i], self.hand_masks[i]
+        if anchors:
+            while hand:
+                piece = hand.bit_length() - 1
+                hand ^= 1 << piece
+                for p in range(len(all_polyominoes[piece].poses)):
+                    valid, offsets, _ = poses[piece, p]
+                    touches = 0
+                    for offset in offsets:
+                        valid &= legal >> offset
+                        touches |= anchors >> offset
+                    if valid & touches: return True
+
+        self.stuck |= 1 << i
+        return False
+
+    def score_for_max_player(self):
+        return self.counts[0] - self.counts[1]
+
+    def is_max_players_turn(self):
+        return (self.turn == 1)
+
+    def open_cells(self):
+        claimed = 0
+        for bits in self.cells: claimed |= bits
+        return self.masks.full & ~claimed
+
+    def forbidden_cells(self, player):
+        # recompute forbidden cells from scratch
+        cells = self.cells[player-1]
+        return self.masks.sides(cells) & ~cells
+
+    def anchor_cells(self, player):
+        # recompute anchor cells from scratch
+        masks = self.masks
+        corners = masks.corners(self.cells[player-1])
+        if player in masks.starts: corners |= masks.starts[player]
+        return corners & self.open_cells() & ~self.forbidden_cells(player)
+
+    def valid_actions(self, form=None):
+        # same action list, in the same order, as State.valid_actions
+        if form is not None: return self.table.convert(self.valid_actions(), form)
+
+        if self.valid_action_list is not None:
+            return self.valid_action_list
+        if self.stuck >> (self.turn-1) & 1:
+            self.valid_action_list = [None]
+            return self.valid_action_list
+
+        poses, table_actions = self.table.poses, self.table.actions
+        legal = self.open_cells() & ~self.forbidden[self.turn-1]
+        anchors = self.anchors[self.turn-1]
+
+        # poses share few distinct offsets, so shift each mask once per offset
+        shifted_legal, shifted_anchors = {}, {}
+
+        actions = []
+        hand = self.hand_masks[self.turn-1]
+        if anchors:
+            while hand:
+                low = hand & -hand
+                hand ^= low
+                polyomino = all_polyominoes[low.bit_length() - 1]
+                for p in range(len(polyomino.posed_offsets)):
+                    # filter the pose's candidate placements:
+                    # all cells legal and at least one cell on an anchor
+                    fits, offsets, ids = poses[polyomino.index, p]
+                    valid, touches = fits, 0
+                    for offset in offsets:
+                        if offset not in shifted_legal:
+                            shifted_legal[offset] = legal >> offset
+                            shifted_anchors[offset] = anchors >> offset
+                        valid &= shifted_legal[offset]
+                        touches |= shifted_anchors[offset]
+                    valid &= touches
+                    while valid:
+                        low = valid & -valid
+                        actions.append(table_actions[ids[low.bit_length() - 1]])
+                        valid ^= low
+
+        if len(actions) == 0:
+            actions = [None]
+            self.stuck |= 1 << (self.turn-1)
+
+        self.valid_action_list = actions
+        return actions
+
+    def sample_action(self, rng=np.random, max_tries=20):
+        # draw a legal action without enumerating them all: pick an anchor, a
+        # piece in hand, a pose and the pose cell placed on the anchor, and
+        # check just that placement; fall back to valid_actions after
+        # max_tries misses, so None still means no moves are left
+        i = self.turn-1
+        if self.stuck >> i & 1: return None
+        anchors, hand = self.anchors[i], self.hand_masks[i]
+        if anchors and hand:
+            table = self.table
+            anchor_cells, pieces = bit_indices(anchors), bit_indices(hand)
+            blocked = self.masks.full & ~(self.open_cells() & ~self.forbidden[i])
+            # one call to the generator for all the draws
+            draws = iter(rng.random_sample(4*max_tries).tolist())
+            for _ in range(max_tries):
+                cell = anchor_cells[int(next(draws) * len(anchor_cells))]
+                piece = pieces[int(next(draws) * len(pieces))]
+                num_poses = len(all_polyominoes[piece].poses)
+                fits, offsets, ids = table.poses[piece, int(next(draws) * num_poses)]
+                k = ids.get(cell - offsets[int(next(draws) * len(offsets))])
+                # k may not cover the anchor when the offset wraps around a row
+                if k is not None and table.cover[k] & anchors and not table.cover[k] & blocked:
+                    return table.actions[k]
+        actions = self.valid_actions()
+        return actions[rng.randint(len(actions))]
+
+    def child_key(self, action):
+        # key of perform(action), without building the new state
+        zobrist = self.zobrist
+        key = self.key ^ zobrist.turns[self.turn-1] ^ zobrist.turns[self.turn % len(self.hand_masks)]
+        if action is not None:
+            polyomino = action[0]
+            cover = self.table.cover[self.table.placement_id(action)]
+            key ^= zobrist.placement(self.turn, cover) ^ zobrist.pieces[self.turn-1][polyomino.index]
+        return key
+
+    def perform(self, action):
+        # action=None skips current player
+        # the new state shares everything that the action does not change
+        new_state = object.__new__(BitboardState)
+        new_state.size = self.size
+        new_state.turn = (self.turn % len(self.hand_masks)) + 1
+        new_state.masks = self.masks
+        new_state.table = self.table
+        new_state.zobrist = self.zobrist
+        new_state.valid_action_list = None
+        new_state._board = None
+        new_state.hand_masks = self.hand_masks
+        new_state.history = self.history
+        new_state.cells = self.cells
+        new_state.counts = self.counts
+        new_state.forbidden = self.forbidden
+        new_state.anchors = self.anchors
+        new_state.stuck = self.stuck
+        new_state.key = self.child_key(action)
+        if action is None: return new_state
+
+        # update only the current player's fields, and the legality masks
+        # from the placed piece's cells
+        table, i = self.table, self.turn-1
+        polyomino, p, row, col = action
+        k = table.placement_id(action)
+        cover = table.cover[k]
+
+        def replace(values, value):
+            return values[:i] + (value,) + values[i+1:]
+
+        new_state.hand_masks = replace(self.hand_masks, self.hand_masks[i] & ~(1 << polyomino.index))
+        new_state.history = replace(self.history, (k, self.history[i]))
+        new_state.cells = replace(self.cells, self.cells[i] | cover)
+        new_state.counts = replace(self.counts, self.counts[i] + len(polyomino.posed_offsets[p]))
+        new_state.forbidden = replace(self.forbidden, self.forbidden[i] | table.sides[k])
+        open_cells = new_state.open_cells()
+        anchors = tuple(anchors & ~cover for anchors in self.anchors)
+        new_state.anchors = replace(anchors,
+            (anchors[i] | table.diagonals[k]) & open_cells & ~new_state.forbidden[i])
+        return new_state
+
+def restore_state(size, turn, hand_masks, play_ids, cells, forbidden, anchors, counts, key, stuck):
+    # inverse of BitboardState.__reduce__
+    state = object.__new__(BitboardState)
+    state.size = size
+    state.turn = turn
+    state.masks = board_masks(size)
+    state.table = bp.get_table(size)
+    state.zobrist = bz.get_keys(size)
+    state.valid_action_list = None
+    state._board = None
+    state.hand_masks = hand_masks
+    history = []
+    for ids in play_ids:
+        previous = None
+        for k in ids: previous = (k, previous)
+        history.append(previous)
+    state.history = tuple(history)
+    state.cells = cells
+    state.forbidden = forbidden
+    state.anchors = anchors
+    state.counts = counts
+    state.key = key
+    state.stuck = stuck
+    return state
@@ -0,0 +1,124 @@
+"""
+This file is for test blockus_bitboard.py
+"""
+import pickle as pk
+import numpy as np
+import unittest as ut
+import blockus_game as bg
+import blockus_bitboard as bb
+
+def play_both(board_size, polyomino_size, seed):
+    # play one random game with both backends, yielding each pair of states
+    rng = np.random.RandomState(seed)
+    array_state = bg.initial_state(board_size, polyomino_size)
+    bit_state = bg.initial_state(board_size, polyomino_size, backend="bitboard")
+    while True:
+        yield array_state, bit_state
+        if array_state.is_leaf(): break
+        actions = array_state.valid_actions()
+        action = actions[rng.choice(len(actions))]
+        array_state = array_state.perform(action)
+        bit_state = bit_state.perform(action)
+
+class BlockusBitboardTestCase(ut.TestCase):
+
+    def test_masks(self):
+        masks = bb.board_masks(3)
+        center = 1 << 4
+        self.assertTrue(masks.sides(center) == (1 << 1) | (1 << 3) | (1 << 5) | (1 << 7))
+        self.assertTrue(masks.corners(center) == (1 << 0) | (1 << 2) | (1 << 6) | (1 << 8))
+        # no wrap-around between rows
+        self.assertTrue(masks.sides(1 << 2) == (1 << 1) | (1 << 5))
+        self.assertTrue(masks.corners(1 << 3) == (1 << 1) | (1 << 7))
+
+    def test_initial_state(self):
+        state = bg.initial_state(board_size=2, polyomino_size=2, backend="bitboard")
+        self.assertTrue(isinstance(state, bb.BitboardState))
+        self.assertTrue(state.cells == (0, 0))
+        self.assertTrue(len(state.valid_actions()) == 3)
+
+    def test_valid_actions_match(self):
+        for board_size, seed in [(2, 0), (3, 1), (6, 2), (6, 3), (10, 4)]:
+            for array_state, bit_state in play_both(board_size, 5, seed):
+                self.assertTrue(array_state.valid_actions() == bit_state.valid_actions())
+                self.assertTrue((array_state.valid_actions("ids") == bit_state.valid_actions("ids")).all())
+                self.assertTrue((array_state.board == bit_state.board).all())
+                for player in [1, 2]:
+                    self.assertTrue(bit_state.cells[player-1] == bb.to_bits(bit_state.board == player))
+
+    def test_incremental_masks(self):
+        for board_size, seed in [(3, 5), (6, 6), (10, 7)]:
+            for _, bit_state in play_both(board_size, 5, seed):
+                for player in [1, 2]:
+                    self.assertTrue(bit_state.forbidden[player-1] == bit_state.forbidden_cells(player))
+                    self.assertTrue(bit_state.anchors[player-1] == bit_state.anchor_cells(player))
+
+    def test_compatible_interface(self):
+        for array_state, bit_state in play_both(6, 5, 8):
+            self.assertTrue(str(array_state) == str(bit_state))
+            self.assertTrue(array_state.is_leaf() == bit_state.is_leaf())
+            self.assertTrue(array_state.score_for_max_player() == bit_state.score_for_max_player())
+            self.assertTrue(array_state.hands == bit_state.hands)
+            self.assertTrue(array_state.key == bit_state.key)
+            array_plays, bit_plays = array_state.plays, bit_state.plays
+            for player in [1, 2]:
+                self.assertTrue(len(array_plays[player]) == len(bit_plays[player]))
+                for (r, c, posed), (br, bc, bposed) in zip(array_plays[player], bit_plays[player]):
+                    self.assertTrue((r, c) == (br, bc) and (posed == bposed).all())
+            # rebuilding from the public fields gives the same state
+            rebuilt = bb.BitboardState(bit_state.size, bit_state.turn,
+                bit_state.hands, bit_state.plays, bit_state.board)
+            for name in ["hand_masks", "cells", "counts", "forbidden", "anchors", "key"]:
+                self.assertTrue(getattr(rebuilt, name) == getattr(bit_state, name))
+
+    def test_has_any_move(self):
+        for board_size, seed in [(3, 11), (6, 12), (10, 13)]:
+            stuck = set()
+            for array_state, bit_state in play_both(board_size, 5, seed):
+                for player in [1, 2]:
+                    has_move = array_state.has_any_move(player)
+                    self.assertTrue(bit_state.has_any_move(player) == has_move)
+                    # once stuck, always stuck
+                    if player in stuck: self.assertFalse(has_move)
+                    if not has_move: stuck.add(player)
+                self.assertTrue(array_state.is_leaf() == bit_state.is_leaf())
+                restored = pk.loads(pk.dumps(bit_state))
+                self.assertTrue(restored.stuck == bit_state.stuck)
+                self.assertTrue(restored.valid_actions() == array_state.valid_actions())
+
+    def test_sample_action(self):
+        rng = np.random.RandomState(0)
+        for array_state, bit_state in play_both(6, 5, 10):
+            valid_actions = bit_state.valid_actions()
+            for _ in range(5):
+                self.assertTrue(bit_state.sample_action(rng) in valid_actions)
+                self.assertTrue(array_state.sample_action(rng) in valid_actions)
+            # no moves left
+            if valid_actions == [None]:
+                self.assertTrue(bit_state.sample_action(rng) is None)
+
+    def test_pickle(self):
+        for _, bit_state in play_both(6, 5, 9):
+            restored = pk.loads(pk.dumps(bit_state))
+            self.assertTrue(str(restored) == str(bit_state))
+            self.assertTrue(restored.valid_actions() == bit_state.valid_actions())
+            for name in ["turn", "hand_masks", "cells", "counts", "forbidden", "anchors", "key"]:
+                self.assertTrue(getattr(restored, name) == getattr(bit_state, name))
+            self.assertTrue(restored.play_ids() == bit_state.play_ids())
+        self.assertTrue(len(pk.dumps(bit_state)) < 1000)
+
+    def test_perform_shares_parent(self):
+        state = bg.initial_state(board_size=6, backend="bitboard")
+        child = state.perform(state.valid_actions()[0])
+        self.assertTrue(state.cells == (0, 0))
+        self.assertTrue(child.history[0][1] is state.history[0])
+        self.assertTrue(child.history[1] is state.history[1])
+        self.assertTrue(child.hand_masks[1] == state.hand_masks[1])
+        self.assertFalse(hasattr(child, "__dict__"))
+
+if __name__ == "__main__":    
+    
+    test_suite = ut.TestLoader().loadTestsFromTestCase(BlockusBitboardTestCase)
+    res = ut.TextTestRunner(verbosity=2).run(test_suite)
+    num, errs, fails = res.testsRun, len(res.errors), len(res.failures)
+    print("score: %d of %d (%d errors, %d failures)" % (num - (errs+fails), num, errs, fails))
@@ -7,42 +7,158 @@
 // Copyright @ 2020 Chen. All rights reserved. //
 /////////////////////////////////////////////////
 """
+import os
+import time
 import itertools as it
+import pickle as pk
+import numpy as np
 import blockus_game as bg
 import mcts as mcts
 import torch as tr
+from polyomino import all_polyominoes
 
-def generate(board_size=6, polyomino_size=5, num_games=2, num_rollouts=10, max_depth=4, choose_method=None):
+def play_game(board_size, polyomino_size, num_rollouts, max_depth, choose_method, game=None, visits=False,
+    backend="bitboard"):
+    # one self-play game, returns the (child state, value) pairs of every searched turn,
+    # or (child state, value, visit count) triples with visits=True
+    # backend is as in blockus_game.initial_state; both play the same game for
+    # the same seed, the bitboard one with much cheaper is_leaf checks
+    data = []
+    state = bg.initial_state(board_size, polyomino_size, backend=backend)
+    for turn in it.count():
+        if game is not None: print("game %d, turn %d..." % (game, turn))
+
+        # Stop when game is over
+        if state.is_leaf(): break
+
+        # Act immediately if only one action available
+        valid_actions = state.valid_actions()
+        if len(valid_actions) == 1:
+            state = state.perform(valid_actions[0])
+            continue
+
+        # Otherwise, use MCTS
+        a, node = mcts.decide_action(state, num_rollouts, choose_method, max_depth)
+        state = node.children()[a].state
+
+        # Add child states and their values to the data
+        Q = node.get_score_estimates()
+        for c,child in enumerate(node.children()):
+            if visits: data.append((child.state, Q[c], child.visit_count))
+            else: data.append((child.state, Q[c]))
+
+    return data
+
+def generate(board_size=6, polyomino_size=5, num_games=2, num_rollouts=10, max_depth=4, choose_method=None,
+    backend="bitboard"):
 
     if choose_method is None: choose_method = mcts.puct
 
     data = []    
     for game in range(num_games):
-    
-        state = bg.initial_state(board_size, polyomino_size)
-        for turn in it.count():
-            print("game %d, turn %d..." % (game, turn))
-    
-            # Stop when game is over
-            if state.is_leaf(): break
-    
-            # Act immediately if only one action available
-            valid_actions = state.valid_actions()
-            if len(valid_actions) == 1:
-                state = state.perform(valid_actions[0])
-                continue
-            
-            # Otherwise, use MCTS
-            a, node = mcts.decide_action(state, num_rollouts, choose_method, max_depth)
-            state = node.children()[a].state
-            
-            # Add child states and their values to the data
-            Q = node.get_score_estimates()
-            for c,child in enumerate(node.children()):
-                data.append((child.state, Q[c]))
+        data.extend(play_game(board_size, polyomino_size, num_rollouts, max_depth, choose_method, game,
+            backend=backend))
+
+    return data
+
+def shard_path(out_dir, game):
+    return os.path.join(out_dir, "game%06d.pkl" % game)
+
+def play_shard(args):
+    # worker: play one game with its own seed and write it to its shard file
+    out_dir, game, seed, board_size, polyomino_size, num_rollouts, max_depth, choose_method, visits, backend = args
+    np.random.seed(seed)
+    data = play_game(board_size, polyomino_size, num_rollouts, max_depth, choose_method, visits=visits,
+        backend=backend)
+    write_shard(out_dir, game, data)
+    return game, len(data)
 
+def write_shard(out_dir, game, data):
+    # write to a temporary file first, so a shard file is never partial
+    path = shard_path(out_dir, game)
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f: pk.dump(data, f)
+    os.replace(tmp, path)
+
+def generate_parallel(out_dir, board_size=6, polyomino_size=5, num_games=2, num_rollouts=10, max_depth=4,
+    choose_method=None, num_workers=None, seed=0, verbose=True, visits=False, backend="bitboard"):
+    # generate in a process pool, one shard file of (state, value) pairs per game in out_dir,
+    # or (state, value, visit count) triples with visits=True
+    # game g is played with seed + g whichever worker plays it, and games whose
+    # shard already exists are skipped, so an interrupted run resumes where it stopped
+    # choose_method must be picklable (a module-level function)
+    # returns the data of all num_games shards
+    import mcts_parallel
+
+    if choose_method is None: choose_method = mcts.puct
+    os.makedirs(out_dir, exist_ok=True)
+    todo = [game for game in range(num_games) if not os.path.exists(shard_path(out_dir, game))]
+
+    if len(todo) > 0:
+        pool = mcts_parallel.get_pool(num_workers)
+        jobs = [(out_dir, game, seed + game, board_size, polyomino_size, num_rollouts, max_depth, choose_method,
+            visits, backend) for game in todo]
+        start, positions = time.time(), 0
+        for done, (game, count) in enumerate(pool.imap_unordered(play_shard, jobs)):
+            positions += count
+            if verbose:
+                elapsed = time.time() - start
+                print("%d of %d games (%d skipped), %d positions, %.2f games/sec" % (
+                    num_games - len(todo) + done + 1, num_games, num_games - len(todo), positions, (done + 1) / elapsed))
+
+    return load_shards(out_dir, num_games)
+
+def load_shards(out_dir, num_games):
+    data = []
+    for game in range(num_games):
+        with open(shard_path(out_dir, game), "rb") as f: data.extend(pk.load(f))
     return data
 
+def symmetries(board):
+    # the board under each symmetry of the square that maps the two start
+    # corners to themselves, with a flag for those that swap the corners, and
+    # so the players: identity, transpose, anti-transpose and half turn
+    anti = board[::-1, ::-1].T
+    return [(board, False), (board.T, False), (anti, True), (board[::-1, ::-1], True)]
+
+swap_colors = np.array([0, 2, 1])
+
+def canonical_key(state):
+    # equal for positions that are the same up to symmetries, with the players
+    # swapped by the corner-swapping ones; values are for the player who just
+    # moved, so they carry over unchanged
+    hands = [tuple(sorted(polyomino.index for polyomino in state.hands[player])) for player in [1, 2]]
+    keys = []
+    for board, swap in symmetries(np.asarray(state.board)):
+        if swap: keys.append((swap_colors[board].tobytes(), hands[1], hands[0], 3 - state.turn))
+        else: keys.append((board.tobytes(), hands[0], hands[1], state.turn))
+    return min(keys)
+
+def dedup(data, min_visits=0):
+    # merge records of the same position (up to canonical_key) into one
+    # (state, value, count) record, value being the visit-weighted mean and
+    # count the number of records merged; records are (state, value) pairs,
+    # counted as one visit each, or (state, value, visits) triples, and
+    # triples with fewer than min_visits visits are dropped first
+    # returns the merged records and a dict of counts with the dedup ratio
+    merged = {}
+    kept = 0
+    for record in data:
+        state, value = record[0], record[1]
+        n = record[2] if len(record) > 2 else 1
+        if n < min_visits: continue
+        kept += 1
+        key = canonical_key(state)
+        if key not in merged: merged[key] = [state, 0., 0, 0]
+        entry = merged[key]
+        entry[1] += n * value
+        entry[2] += n
+        entry[3] += 1
+    records = [(state, total / n if n > 0 else 0., count) for state, total, n, count in merged.values()]
+    stats = {"records": len(data), "kept": kept, "unique": len(records),
+        "dedup_ratio": kept / len(records) if len(records) > 0 else 1.}
+    return records, stats
+
 def encode(state):
     expected = tr.zeros(3, len(state.board), len(state.board[0]))
     for r in range(len(state.board)):
@@ -51,21 +167,50 @@ def encode(state):
             expected[s][r][c] = 1
     return expected
 
+# cells in each polyomino, for the hand planes of encode_batch
+cell_counts = [int(polyomino.array.sum()) for polyomino in all_polyominoes]
+total_cells = sum(cell_counts)
+
+def encode_batch(states, out=None, extra_planes=False):
+    # encode(state) for every state at once, stacked along dimension 0
+    # extra_planes appends three constant planes: the fraction of its full
+    # piece set each player still holds, and 1 when player 1 is to move
+    # out is a reusable float tensor with at least len(states) rows, which is
+    # written in place, and the leading rows are returned
+    boards = np.stack([state.board for state in states])
+    n, size = len(boards), boards.shape[1]
+    channels = 6 if extra_planes else 3
+    if out is None: out = tr.empty(n, channels, size, size)
+    planes = out[:n].numpy()
+    planes[:, :3] = boards[:, None] == np.arange(3)[None, :, None, None]
+    if extra_planes:
+        for i, state in enumerate(states):
+            for player, hand in state.hands.items():
+                planes[i, 2+player] = sum(cell_counts[polyomino.index] for polyomino in hand) / total_cells
+            planes[i, 5] = state.turn == 1
+    return out[:n]
+
 def get_batch(board_size=6, polyomino_size=5, num_games=2, num_rollouts=50, max_depth=6, choose_method=None):
     data = generate(board_size,polyomino_size,num_games,num_rollouts,max_depth,choose_method)
+    return make_batch(data, board_size)
+
+def make_batch(data, board_size):
     input = tr.zeros(len(data),3,board_size,board_size)
+    if len(data) > 0: encode_batch([record[0] for record in data], out=input)
     output = tr.zeros(len(data),0)
     for i in range(len(data)):
-        e_state = encode(data[i][0])
-        input[i] = e_state
         output[i] = data[i][1]
     return (input, output)
 
 if __name__ == "__main__":
     
     board_size, num_games = 6, 50
-    inputs, outputs = get_batch(board_size, num_games=num_games)
+    data = generate_parallel("data%d" % board_size, board_size, num_games=num_games, num_rollouts=50, max_depth=6,
+        visits=True)
+    data, stats = dedup(data, min_visits=1)
+    print("%(records)d records, %(kept)d visited, %(unique)d unique positions (%(dedup_ratio).2fx)" % stats)
 
-    import pickle as pk
-    with open("data%d.pkl" % board_size, "wb") as f: pk.dump((inputs, outputs), f)
+    # append to the memory-mapped training set, see blockus_dataset
+    import blockus_dataset as bds
+    with bds.ShardWriter("dataset%d" % board_size, board_size) as writer: writer.append_data(data)
 
@@ -1,11 +1,14 @@
 """
 This file is for test blockus_data.py
 """
+import os
+import tempfile
 import numpy as np
 import torch as tr
 import unittest as ut
 import blockus_data as bd
 import blockus_game as bg
+import mcts
 
 class BlockusDataTestCase(ut.TestCase):
 
@@ -26,6 +29,53 @@ class BlockusDataTestCase(ut.TestCase):
         expected[[0, 2],1,1] = tr.tensor([0.,1.])
         self.assertTrue(tr.allclose(actual, expected))
 
+    def test_encode_batch(self):
+        rng = np.random.RandomState(0)
+        for backend in ["array", "bitboard"]:
+            states = [bg.initial_state(board_size=5, backend=backend)]
+            while not states[-1].is_leaf():
+                actions = states[-1].valid_actions()
+                states.append(states[-1].perform(actions[rng.choice(len(actions))]))
+            expected = tr.stack([bd.encode(state) for state in states])
+            self.assertTrue(tr.equal(bd.encode_batch(states), expected))
+
+            # in place, into the leading rows of a larger buffer
+            out = tr.zeros(len(states)+3, 6, 5, 5)
+            actual = bd.encode_batch(states, out=out, extra_planes=True)
+            self.assertTrue(actual.data_ptr() == out.data_ptr())
+            self.assertTrue(tr.equal(actual[:, :3], expected))
+            self.assertTrue(tr.allclose(actual[0, 3:5], tr.ones(2, 5, 5)))
+            self.assertTrue(tr.allclose(actual[:, 5, 0, 0], tr.tensor([state.turn == 1 for state in states]).float()))
+            self.assertTrue((actual[-1, 3:5] < 1).all())
+
+    def test_canonical_key(self):
+        state = bg.initial_state(board_size=5)
+        for a in [3, 5, 7]: state = state.perform(state.valid_actions()[a])
+        transposed = bg.State(5, state.turn, state.hands, state.plays, state.board.T.copy())
+        self.assertTrue(bd.canonical_key(transposed) == bd.canonical_key(state))
+        # the corner-swapping symmetry also swaps the players
+        anti = bd.swap_colors[state.board[::-1, ::-1].T]
+        swapped = bg.State(5, 3 - state.turn, {1: state.hands[2], 2: state.hands[1]}, state.plays, anti)
+        self.assertTrue(bd.canonical_key(swapped) == bd.canonical_key(state))
+        unswapped = bg.State(5, state.turn, state.hands, state.plays, state.board[::-1, ::-1].T.copy())
+        self.assertFalse(bd.canonical_key(unswapped) == bd.canonical_key(state))
+        self.assertFalse(bd.canonical_key(state.perform(None)) == bd.canonical_key(state))
+
+    def test_dedup(self):
+        state = bg.initial_state(board_size=5)
+        child = state.perform(state.valid_actions()[0])
+        transposed = bg.State(5, child.turn, child.hands, child.plays, child.board.T.copy())
+        data = [(child, 1., 3), (transposed, -1., 1), (child, 5., 0), (state, 2., 2)]
+        records, stats = bd.dedup(data, min_visits=1)
+        self.assertTrue(len(records) == 2)
+        self.assertTrue(records[0][0] is child)
+        self.assertTrue(records[0][1:] == (0.5, 2))
+        self.assertTrue(records[1][1:] == (2., 1))
+        self.assertTrue(stats == {"records": 4, "kept": 3, "unique": 2, "dedup_ratio": 1.5})
+        # pairs count as one visit each
+        records, _ = bd.dedup([(child, 1.), (transposed, 0.)])
+        self.assertTrue(records[0][1:] == (0.5, 2))
+
     def test_get_batch(self):
         inputs, outputs = bd.get_batch(
             board_size=2, polyomino_size=2, num_games=1, num_rollouts=1, max_depth=2,
@@ -41,6 +91,27 @@ class BlockusDataTestCase(ut.TestCase):
         expected[:2,0,0] = tr.tensor([0, 1])
         self.assertTrue(tr.allclose(inputs[0], expected))
         
+    def test_generate_parallel(self):
+        with tempfile.TemporaryDirectory() as out_dir:
+            data = bd.generate_parallel(out_dir, board_size=3, polyomino_size=3, num_games=3,
+                num_rollouts=3, max_depth=2, num_workers=2, verbose=False)
+            self.assertTrue(sorted(os.listdir(out_dir)) == ["game%06d.pkl" % g for g in range(3)])
+            self.assertTrue(len(data) > 0)
+            # resume after losing a shard: only that game is replayed, with the same seed
+            os.remove(bd.shard_path(out_dir, 1))
+            resumed = bd.generate_parallel(out_dir, board_size=3, polyomino_size=3, num_games=3,
+                num_rollouts=3, max_depth=2, num_workers=2, verbose=False)
+            self.assertTrue([(str(s), v) for s, v in resumed] == [(str(s), v) for s, v in data])
+
+    def test_play_game_backends(self):
+        # the same game, and records, from either backend with the same seed
+        games = []
+        for backend in ["array", "bitboard"]:
+            np.random.seed(3)
+            data = bd.play_game(5, 3, 10, 3, mcts.puct, backend=backend)
+            games.append([(str(s), v) for s, v in data])
+        self.assertTrue(len(games[0]) > 0 and games[0] == games[1])
+
 if __name__ == "__main__":    
     
     test_suite = ut.TestLoader().loadTestsFromTestCase(BlockusDataTestCase)
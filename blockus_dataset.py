@@ -0,0 +1,170 @@
+"""
+Sharded on-disk training data
+
+A dataset is a directory of fixed-size shards, each a pair of .npy files:
+inputs as uint8 planes (n, channels, size, size) as made by
+blockus_data.encode_batch, and targets as float32 (n, 1). With 6 channels
+(extra_planes) the hand planes, fractions of blockus_data.total_cells, are
+stored as cell counts and scaled back when read. manifest.json lists
+the shards and their row counts. Only the last shard may be partly full;
+appending fills it up and then starts new shards. Shards are read through
+memory maps, so opening a dataset costs the same at any size.
+"""
+import os
+import json
+import numpy as np
+import torch as tr
+import blockus_data as bd
+
+def read_manifest(path):
+    with open(os.path.join(path, "manifest.json")) as f: return json.load(f)
+
+def save(path, name, array):
+    # write to a temporary file first, so readers never see a partial file
+    tmp = os.path.join(path, name + ".tmp.npy")
+    np.save(tmp, array)
+    os.replace(tmp, os.path.join(path, name))
+
+def save_manifest(path, manifest):
+    tmp = os.path.join(path, "manifest.json.tmp")
+    with open(tmp, "w") as f: json.dump(manifest, f, indent=1)
+    os.replace(tmp, os.path.join(path, "manifest.json"))
+
+def to_stored(inputs, channels):
+    # uint8 planes for a shard, hand planes as cell counts
+    inputs = np.asarray(inputs, dtype=np.float64)
+    if channels == 6: inputs = np.concatenate([inputs[:, :3], inputs[:, 3:5] * bd.total_cells, inputs[:, 5:]], axis=1)
+    stored = np.rint(inputs)
+    if not (np.abs(stored - inputs) < 1e-3).all() or stored.min() < 0 or stored.max() > 255:
+        raise ValueError("inputs are not planes as from blockus_data.encode_batch")
+    return stored.astype(np.uint8)
+
+class ShardWriter(object):
+    def __init__(self, path, board_size=6, channels=3, shard_size=4096):
+        # opens the dataset at path for appending, creating it if needed,
+        # in which case it holds board_size boards with channels planes
+        self.path = path
+        if os.path.exists(os.path.join(path, "manifest.json")):
+            self.manifest = read_manifest(path)
+        else:
+            os.makedirs(path, exist_ok=True)
+            self.manifest = {"board_size": board_size, "channels": channels,
+                "shard_size": shard_size, "shards": []}
+        size, channels = self.manifest["board_size"], self.manifest["channels"]
+        self.inputs = np.zeros((0, channels, size, size), dtype=np.uint8)
+        self.targets = np.zeros((0, 1), dtype=np.float32)
+        shards = self.manifest["shards"]
+        if len(shards) > 0 and shards[-1]["count"] < self.manifest["shard_size"]:
+            # refill the partial last shard
+            last = shards.pop()
+            self.inputs = np.load(os.path.join(path, last["inputs"]))
+            self.targets = np.load(os.path.join(path, last["targets"]))
+
+    def append(self, inputs, targets):
+        # inputs: (n, channels, size, size) planes as from encode_batch, targets: n values
+        self.inputs = np.concatenate([self.inputs, to_stored(inputs, self.manifest["channels"])])
+        self.targets = np.concatenate([self.targets, np.asarray(targets, dtype=np.float32).reshape(-1, 1)])
+        shard_size = self.manifest["shard_size"]
+        while len(self.inputs) >= shard_size:
+            self.write_shard(self.inputs[:shard_size], self.targets[:shard_size])
+            self.inputs, self.targets = self.inputs[shard_size:], self.targets[shard_size:]
+
+    def append_data(self, data):
+        # (state, value, ...) records as made by blockus_data.generate or dedup
+        if len(data) == 0: return
+        extra_planes = self.manifest["channels"] == 6
+        inputs = bd.encode_batch([record[0] for record in data], extra_planes=extra_planes)
+        self.append(inputs.numpy(), [record[1] for record in data])
+
+    def write_shard(self, inputs, targets):
+        shards = self.manifest["shards"]
+        shard = {"inputs": "inputs%05d.npy" % len(shards), "targets": "targets%05d.npy" % len(shards),
+            "count": len(inputs)}
+        save(self.path, shard["inputs"], inputs)
+        save(self.path, shard["targets"], targets)
+        shards.append(shard)
+        save_manifest(self.path, self.manifest)
+
+    def close(self):
+        # write the partial last shard, it is refilled by the next writer
+        if len(self.inputs) > 0: self.write_shard(self.inputs, self.targets)
+        else: save_manifest(self.path, self.manifest)
+        self.inputs, self.targets = self.inputs[:0], self.targets[:0]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class ShardedDataset(object):
+    def __init__(self, path):
+        self.path = path
+        self.manifest = read_manifest(path)
+        self.board_size = self.manifest["board_size"]
+        self.channels = self.manifest["channels"]
+        self.inputs, self.targets = [], []
+        for shard in self.manifest["shards"]:
+            self.inputs.append(np.load(os.path.join(path, shard["inputs"]), mmap_mode="r"))
+            self.targets.append(np.load(os.path.join(path, shard["targets"]), mmap_mode="r"))
+        self.starts = np.cumsum([0] + [shard["count"] for shard in self.manifest["shards"]])
+
+    def __len__(self):
+        return int(self.starts[-1])
+
+    def batch(self, indices):
+        # float tensors (len(indices), channels, size, size) and (len(indices), 1)
+        indices = np.asarray(indices)
+        x = np.empty((len(indices), self.channels, self.board_size, self.board_size), dtype=np.float32)
+        y = np.empty((len(indices), 1), dtype=np.float32)
+        shard = np.searchsorted(self.starts, indices, side="right") - 1
+        for s in np.unique(shard):
+            rows = shard == s
+            local = indices[rows] - self.starts[s]
+            x[rows] = self.inputs[s][local]
+            y[rows] = self.targets[s][local]
+        if self.channels == 6: x[:, 3:5] /= bd.total_cells
+        return tr.from_numpy(x), tr.from_numpy(y)
+
+    def tensors(self):
+        # the whole dataset in memory
+        return self.batch(np.arange(len(self)))
+
+class BatchStream(tr.utils.data.IterableDataset):
+    # shuffled mini-batches from a ShardedDataset, one pass per iteration
+    # a few shards at a time are shuffled together, so reads stay within a
+    # window of shards_per_window memory maps; with several DataLoader
+    # workers each one streams its own share of the windows
+    # use with DataLoader(stream, batch_size=None); the order depends on the
+    # epoch, which iterating advances only in the process doing it, so with
+    # DataLoader workers call set_epoch before every pass
+    def __init__(self, path, batch_size=64, shards_per_window=4, seed=None, indices=None):
+        # indices restricts the stream to those rows, e.g. a train split
+        # seed=None draws a seed here, so that DataLoader workers, each with a
+        # copy of the stream, split up the same shard order
+        self.path = path
+        self.batch_size = batch_size
+        self.shards_per_window = shards_per_window
+        self.seed = np.random.randint(2**31) if seed is None else seed
+        self.indices = indices
+        self.epoch = 0
+
+    def set_epoch(self, epoch):
+        self.epoch = epoch
+
+    def __iter__(self):
+        dataset = ShardedDataset(self.path)
+        rng = np.random.RandomState(self.seed + self.epoch)
+        self.epoch += 1
+
+        rows = np.arange(len(dataset)) if self.indices is None else np.sort(self.indices)
+        shard = np.searchsorted(dataset.starts, rows, side="right") - 1
+        order = rng.permutation(len(dataset.inputs))
+        windows = [order[w:w+self.shards_per_window] for w in range(0, len(order), self.shards_per_window)]
+        info = tr.utils.data.get_worker_info()
+        if info is not None: windows = windows[info.id::info.num_workers]
+
+        for window in windows:
+            window_rows = rng.permutation(rows[np.isin(shard, window)])
+            for b in range(0, len(window_rows), self.batch_size):
+                yield dataset.batch(window_rows[b:b+self.batch_size])
@@ -0,0 +1,98 @@
+"""
+This file is for test blockus_dataset.py
+"""
+import os
+import tempfile
+import numpy as np
+import torch as tr
+import unittest as ut
+import blockus_game as bg
+import blockus_data as bd
+import blockus_dataset as bds
+
+def random_rows(n, rng, board_size=3):
+    inputs = rng.randint(2, size=(n, 3, board_size, board_size)).astype(np.uint8)
+    targets = rng.randn(n).astype(np.float32)
+    return inputs, targets
+
+class BlockusDatasetTestCase(ut.TestCase):
+
+    def test_append(self):
+        rng = np.random.RandomState(0)
+        inputs, targets = random_rows(23, rng)
+        with tempfile.TemporaryDirectory() as path:
+            with bds.ShardWriter(path, board_size=3, shard_size=5) as writer:
+                writer.append(inputs[:7], targets[:7])
+                writer.append(inputs[7:13], targets[7:13])
+            # a later writer refills the partial last shard
+            with bds.ShardWriter(path) as writer:
+                writer.append(inputs[13:], targets[13:])
+
+            manifest = bds.read_manifest(path)
+            self.assertTrue([shard["count"] for shard in manifest["shards"]] == [5, 5, 5, 5, 3])
+            self.assertTrue(sorted(f for f in os.listdir(path) if "tmp" in f) == [])
+
+            dataset = bds.ShardedDataset(path)
+            self.assertTrue(len(dataset) == 23)
+            x, y = dataset.tensors()
+            self.assertTrue(tr.equal(x, tr.tensor(inputs).float()))
+            self.assertTrue(tr.equal(y, tr.tensor(targets).reshape(-1, 1)))
+            x, y = dataset.batch([22, 0, 6])
+            self.assertTrue(tr.equal(y.flatten(), tr.tensor(targets[[22, 0, 6]])))
+
+    def test_append_data(self):
+        state = bg.initial_state(board_size=3)
+        data = [(state, 0.5), (state.perform(state.valid_actions()[0]), -1.)]
+        with tempfile.TemporaryDirectory() as path:
+            with bds.ShardWriter(path, board_size=3) as writer: writer.append_data(data)
+            x, y = bds.ShardedDataset(path).tensors()
+            self.assertTrue(tr.equal(x, bd.encode_batch([s for s, _ in data])))
+            self.assertTrue(tr.equal(y, tr.tensor([[0.5], [-1.]])))
+        # hand planes are kept exactly
+        with tempfile.TemporaryDirectory() as path:
+            with bds.ShardWriter(path, board_size=3, channels=6) as writer: writer.append_data(data)
+            x, _ = bds.ShardedDataset(path).tensors()
+            self.assertTrue(tr.equal(x, bd.encode_batch([s for s, _ in data], extra_planes=True)))
+            self.assertTrue(0 < x[1, 3, 0, 0] < 1)
+            # and other values are refused rather than rounded
+            with bds.ShardWriter(path) as writer:
+                with self.assertRaises(ValueError): writer.append(np.full((1, 6, 3, 3), 0.5), [0.])
+
+    def test_batch_stream(self):
+        rng = np.random.RandomState(1)
+        inputs, targets = random_rows(50, rng)
+        with tempfile.TemporaryDirectory() as path:
+            with bds.ShardWriter(path, board_size=3, shard_size=8) as writer: writer.append(inputs, targets)
+            stream = bds.BatchStream(path, batch_size=6, shards_per_window=2, seed=0)
+            batches = list(stream)
+            self.assertTrue(all(len(x) == len(y) <= 6 for x, y in batches))
+            seen = tr.cat([y for _, y in batches]).flatten()
+            # every row exactly once, shuffled
+            self.assertTrue(tr.equal(seen.sort().values, tr.tensor(targets).sort().values))
+            self.assertFalse(tr.equal(seen, tr.tensor(targets)))
+            # a new order every pass
+            again = tr.cat([y for _, y in stream]).flatten()
+            self.assertFalse(tr.equal(seen, again))
+            # restricted to a split
+            split = bds.BatchStream(path, batch_size=6, indices=np.arange(10, 20))
+            seen = tr.cat([y for _, y in split]).flatten()
+            self.assertTrue(tr.equal(seen.sort().values, tr.tensor(targets[10:20]).sort().values))
+            # through a DataLoader with two workers, every row once even without a seed
+            for seed in [0, None]:
+                stream = bds.BatchStream(path, batch_size=6, shards_per_window=1, seed=seed)
+                loader = tr.utils.data.DataLoader(stream, batch_size=None, num_workers=2)
+                seen = tr.cat([y for _, y in loader]).flatten()
+                self.assertTrue(tr.equal(seen.sort().values, tr.tensor(targets).sort().values))
+            # where set_epoch picks the order of each pass
+            def epoch_order(epoch):
+                stream.set_epoch(epoch)
+                return tr.cat([y for _, y in loader]).flatten()
+            self.assertTrue(tr.equal(epoch_order(1), epoch_order(1)))
+            self.assertFalse(tr.equal(epoch_order(1), epoch_order(2)))
+
+if __name__ == "__main__":
+
+    test_suite = ut.TestLoader().loadTestsFromTestCase(BlockusDatasetTestCase)
+    res = ut.TextTestRunner(verbosity=2).run(test_suite)
+    num, errs, fails = res.testsRun, len(res.errors), len(res.failures)
+    print("score: %d of %d (%d errors, %d failures)" % (num - (errs+fails), num, errs, fails))
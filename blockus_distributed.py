@@ -0,0 +1,223 @@
+"""
+Self-play data generation across hosts
+
+A coordinator hands out game jobs to worker processes over sockets
+(multiprocessing.connection, pickled messages with an authkey), and writes
+each finished game's (state, value) records to its shard file as in
+blockus_data.generate_parallel, so runs are resumable the same way.
+Messages:
+    worker -> coordinator: ("hello", name), ("alive",), ("result", game, data)
+    coordinator -> worker: ("job", job), ("stop",)
+where job = (game, seed, board_size, polyomino_size, num_rollouts, max_depth, backend).
+Workers send ("alive",) every heartbeat_interval seconds while playing. A job
+goes back in the queue when its worker disconnects, is not heard from for
+heartbeat_timeout seconds (e.g. its host lost power or network), or exceeds
+job_timeout.
+
+There is no default authkey: anyone who has it can get the coordinator to
+unpickle their messages. The scripts read it from BLOCKUS_AUTHKEY.
+On the coordinator host:
+    BLOCKUS_AUTHKEY=... python blockus_distributed.py coordinator PORT OUT_DIR NUM_GAMES
+On each worker host:
+    BLOCKUS_AUTHKEY=... python blockus_distributed.py worker HOST PORT
+"""
+import os
+import sys
+import time
+import socket
+import threading
+import multiprocessing as mp
+from multiprocessing.connection import Listener, Client
+import numpy as np
+import blockus_data as bd
+import mcts
+
+def make_jobs(num_games, board_size=6, polyomino_size=5, num_rollouts=10, max_depth=4, seed=0,
+    backend="bitboard"):
+    return [(game, seed + game, board_size, polyomino_size, num_rollouts, max_depth, backend)
+        for game in range(num_games)]
+
+class WorkerStats(object):
+    def __init__(self, name):
+        self.name = name
+        self.games = 0
+        self.positions = 0
+        self.busy = 0. # seconds spent on finished games
+        self.failed = 0 # jobs handed back to the queue
+        self.connected = True
+        self.last_seen = time.time()
+    def lag(self):
+        # seconds since this worker was last heard from
+        return time.time() - self.last_seen
+    def games_per_sec(self):
+        return self.games / self.busy if self.busy > 0 else 0.
+
+class Coordinator(object):
+    def __init__(self, out_dir, jobs, authkey, address=("localhost", 0), heartbeat_timeout=60.,
+        job_timeout=None):
+        # jobs whose shard is already in out_dir are done
+        # address port 0 picks a free port, see self.address
+        os.makedirs(out_dir, exist_ok=True)
+        self.out_dir = out_dir
+        self.jobs = jobs
+        self.pending = [job for job in jobs if not os.path.exists(bd.shard_path(out_dir, job[0]))]
+        self.done = set(job[0] for job in jobs) - set(job[0] for job in self.pending)
+        self.heartbeat_timeout = heartbeat_timeout
+        self.job_timeout = job_timeout
+        self.workers = {}
+        self.lock = threading.Condition()
+        self.closed = False
+        self.listener = Listener(address, authkey=authkey)
+        self.address = self.listener.address
+        threading.Thread(target=self.accept, daemon=True).start()
+
+    def accept(self):
+        while not self.closed:
+            # a failed handshake (wrong authkey, dropped connection) only loses that client
+            try: conn = self.listener.accept()
+            except (OSError, EOFError, mp.AuthenticationError): continue
+            threading.Thread(target=self.serve, args=(conn,), daemon=True).start()
+
+    def finished(self):
+        return len(self.done) == len(self.jobs)
+
+    def next_job(self):
+        # wait for a pending job, or None once every job is done; jobs still
+        # running elsewhere may come back if their worker fails
+        with self.lock:
+            while len(self.pending) == 0 and not self.finished(): self.lock.wait()
+            return None if self.finished() else self.pending.pop(0)
+
+    def requeue(self, job, stats):
+        with self.lock:
+            stats.failed += 1
+            self.pending.insert(0, job)
+            self.lock.notify_all()
+
+    def finish(self, job, data, stats, elapsed):
+        with self.lock:
+            stats.games += 1
+            stats.positions += len(data)
+            stats.busy += elapsed
+            bd.write_shard(self.out_dir, job[0], data)
+            self.done.add(job[0])
+            self.lock.notify_all()
+
+    def serve(self, conn):
+        job, stats = None, None
+        try:
+            _, name = check_message(conn.recv(), "hello")
+            with self.lock:
+                if name in self.workers: name = "%s#%d" % (name, len(self.workers))
+                stats = self.workers[name] = WorkerStats(name)
+            while True:
+                job = self.next_job()
+                if job is None:
+                    conn.send(("stop",))
+                    break
+                start = time.time()
+                conn.send(("job", job))
+                deadline = None if self.job_timeout is None else start + self.job_timeout
+                while True:
+                    wait = self.heartbeat_timeout
+                    if deadline is not None: wait = min(wait, deadline - time.time())
+                    if wait <= 0 or not conn.poll(wait): raise TimeoutError()
+                    message = check_message(conn.recv(), "alive", "result")
+                    stats.last_seen = time.time()
+                    if message[0] == "result": break
+                _, game, data = message
+                if game != job[0]: raise ValueError("result for game %r, not %d" % (game, job[0]))
+                self.finish(job, data, stats, stats.last_seen - start)
+                job = None
+        except Exception:
+            # lost, silent or misbehaving worker (malformed messages, unpickling
+            # errors from another code version): its job goes to someone else
+            if job is not None: self.requeue(job, stats)
+        finally:
+            if stats is not None: stats.connected = False
+            conn.close()
+
+    def report(self):
+        lines = ["%d of %d games done, %d pending" % (len(self.done), len(self.jobs), len(self.pending))]
+        for name, stats in sorted(self.workers.items()):
+            lines.append("  %s: %d games, %d positions, %.2f games/sec, lag %.1fs, %d failed%s" % (
+                name, stats.games, stats.positions, stats.games_per_sec(), stats.lag(), stats.failed,
+                "" if stats.connected else " (gone)"))
+        return "\n".join(lines)
+
+    def run(self, report_every=10., verbose=True):
+        # wait for all jobs, printing a report every report_every seconds,
+        # then return the records of all jobs in order
+        last = time.time()
+        with self.lock:
+            while not self.finished():
+                self.lock.wait(timeout=1.)
+                if verbose and time.time() - last >= report_every:
+                    print(self.report())
+                    last = time.time()
+        if verbose: print(self.report())
+        self.close()
+        return bd.load_shards(self.out_dir, len(self.jobs))
+
+    def close(self):
+        self.closed = True
+        self.listener.close()
+
+# message kind -> length of a well-formed message
+message_lengths = {"hello": 2, "alive": 1, "result": 3}
+
+def check_message(message, *kinds):
+    # message if it is a well-formed message of one of kinds, else ValueError
+    if not (isinstance(message, tuple) and len(message) > 0 and message[0] in kinds
+        and len(message) == message_lengths[message[0]]):
+        raise ValueError("unexpected message %r" % (message,))
+    return message
+
+def heartbeat(conn, playing, interval):
+    # send ("alive",) every interval seconds until playing is cleared
+    while not playing.wait(interval): conn.send(("alive",))
+
+def run_worker(address, authkey, name=None, heartbeat_interval=10.):
+    # play jobs from the coordinator at address until told to stop
+    if name is None: name = "%s:%d" % (socket.gethostname(), os.getpid())
+    conn = Client(address, authkey=authkey)
+    conn.send(("hello", name))
+    while True:
+        message = conn.recv()
+        if message[0] == "stop": break
+        game, seed, board_size, polyomino_size, num_rollouts, max_depth, backend = message[1]
+        done = threading.Event()
+        beats = threading.Thread(target=heartbeat, args=(conn, done, heartbeat_interval), daemon=True)
+        beats.start()
+        np.random.seed(seed)
+        data = bd.play_game(board_size, polyomino_size, num_rollouts, max_depth, mcts.puct, backend=backend)
+        done.set()
+        beats.join() # so the result is not sent while a heartbeat is
+        conn.send(("result", game, data))
+    conn.close()
+
+def run_local(out_dir, jobs, num_workers=None, verbose=True, **kwargs):
+    # coordinator plus num_workers worker processes on localhost, with a fresh authkey
+    if num_workers is None: num_workers = mp.cpu_count()
+    authkey = os.urandom(32)
+    coordinator = Coordinator(out_dir, jobs, authkey, **kwargs)
+    workers = [mp.Process(target=run_worker, args=(coordinator.address, authkey), kwargs={"name": "local%d" % w})
+        for w in range(num_workers)]
+    for worker in workers: worker.start()
+    data = coordinator.run(verbose=verbose)
+    for worker in workers: worker.join()
+    return data
+
+if __name__ == "__main__":
+
+    authkey = os.environ.get("BLOCKUS_AUTHKEY")
+    if not authkey: sys.exit("set BLOCKUS_AUTHKEY to a secret shared by the coordinator and its workers")
+    authkey = authkey.encode()
+    if len(sys.argv) > 1 and sys.argv[1] == "worker":
+        run_worker((sys.argv[2], int(sys.argv[3])), authkey)
+    else:
+        port, out_dir, num_games = int(sys.argv[2]), sys.argv[3], int(sys.argv[4])
+        jobs = make_jobs(num_games, num_rollouts=50, max_depth=6)
+        coordinator = Coordinator(out_dir, jobs, authkey, address=("", port))
+        print("coordinator listening on port %d" % port)
+        coordinator.run()
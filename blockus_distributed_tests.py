@@ -0,0 +1,116 @@
+"""
+This file is for test blockus_distributed.py
+"""
+import os
+import tempfile
+import threading
+import unittest as ut
+from multiprocessing.connection import Client
+from multiprocessing import AuthenticationError
+import blockus_data as bd
+import blockus_distributed as bdist
+
+AUTHKEY = b"test"
+
+def crash_worker(address):
+    # take one job and disconnect without an answer
+    conn = Client(address, authkey=AUTHKEY)
+    conn.send(("hello", "crash"))
+    conn.recv()
+    conn.close()
+
+def bad_worker(address, message):
+    # take one job and answer with message
+    conn = Client(address, authkey=AUTHKEY)
+    conn.send(("hello", "bad"))
+    conn.recv()
+    conn.send(message)
+    conn.close()
+
+def silent_worker(address):
+    # take one job and go quiet without disconnecting, as on a lost host;
+    # returns the connection to keep it open
+    conn = Client(address, authkey=AUTHKEY)
+    conn.send(("hello", "silent"))
+    conn.recv()
+    return conn
+
+class BlockusDistributedTestCase(ut.TestCase):
+
+    def test_run_local(self):
+        jobs = bdist.make_jobs(4, board_size=3, polyomino_size=3, num_rollouts=3, max_depth=2)
+        with tempfile.TemporaryDirectory() as out_dir:
+            data = bdist.run_local(out_dir, jobs, num_workers=3, verbose=False)
+            self.assertTrue(sorted(os.listdir(out_dir)) == ["game%06d.pkl" % g for g in range(4)])
+            # same records as generate_parallel with the same seeds
+            with tempfile.TemporaryDirectory() as other_dir:
+                expected = bd.generate_parallel(other_dir, board_size=3, polyomino_size=3, num_games=4,
+                    num_rollouts=3, max_depth=2, num_workers=2, verbose=False)
+            self.assertTrue([(str(s), v) for s, v in data] == [(str(s), v) for s, v in expected])
+
+    def test_dead_worker(self):
+        jobs = bdist.make_jobs(3, board_size=3, polyomino_size=3, num_rollouts=3, max_depth=2)
+        with tempfile.TemporaryDirectory() as out_dir:
+            coordinator = bdist.Coordinator(out_dir, jobs, AUTHKEY)
+            crash_worker(coordinator.address)
+            # the crashed worker's job is handed to the next worker
+            worker = threading.Thread(target=bdist.run_worker, args=(coordinator.address, AUTHKEY), kwargs={"name": "ok"})
+            worker.start()
+            data = coordinator.run(verbose=False)
+            worker.join()
+            self.assertTrue(len(data) > 0)
+            self.assertTrue(coordinator.workers["crash"].failed == 1)
+            self.assertTrue(coordinator.workers["crash"].games == 0)
+            self.assertTrue(coordinator.workers["ok"].games == 3)
+            self.assertTrue("3 of 3 games done" in coordinator.report())
+
+    def test_bad_worker(self):
+        self.assertTrue(bdist.check_message(("alive",), "alive", "result") == ("alive",))
+        for message in [None, (), ("result", 0), ("hello", "x"), "alive"]:
+            with self.assertRaises(ValueError): bdist.check_message(message, "alive", "result")
+        for message in [None, ("result", 5, []), ("bogus",)]:
+            jobs = bdist.make_jobs(2, board_size=3, polyomino_size=3, num_rollouts=3, max_depth=2)
+            with tempfile.TemporaryDirectory() as out_dir:
+                coordinator = bdist.Coordinator(out_dir, jobs, AUTHKEY)
+                bad_worker(coordinator.address, message)
+                # the bad worker's job is handed to the next worker
+                worker = threading.Thread(target=bdist.run_worker, args=(coordinator.address, AUTHKEY),
+                    kwargs={"name": "ok"})
+                worker.start()
+                coordinator.run(verbose=False)
+                worker.join()
+                self.assertTrue(coordinator.workers["bad"].failed == 1)
+                self.assertTrue(coordinator.workers["ok"].games == 2)
+
+    def test_lost_worker(self):
+        jobs = bdist.make_jobs(2, board_size=3, polyomino_size=3, num_rollouts=3, max_depth=2)
+        with tempfile.TemporaryDirectory() as out_dir:
+            coordinator = bdist.Coordinator(out_dir, jobs, AUTHKEY, heartbeat_timeout=0.5)
+            conn = silent_worker(coordinator.address)
+            # a worker that keeps sending heartbeats is not timed out during a long game
+            worker = threading.Thread(target=bdist.run_worker, args=(coordinator.address, AUTHKEY),
+                kwargs={"name": "ok", "heartbeat_interval": 0.1})
+            worker.start()
+            data = coordinator.run(verbose=False)
+            worker.join()
+            conn.close()
+            self.assertTrue(coordinator.workers["silent"].failed == 1)
+            self.assertTrue(coordinator.workers["ok"].games == 2)
+
+    def test_authkey(self):
+        jobs = bdist.make_jobs(1, board_size=3, polyomino_size=3, num_rollouts=3, max_depth=2)
+        with tempfile.TemporaryDirectory() as out_dir:
+            coordinator = bdist.Coordinator(out_dir, jobs, AUTHKEY)
+            with self.assertRaises(AuthenticationError): Client(coordinator.address, authkey=b"wrong")
+            # and the coordinator still takes workers with the right key
+            worker = threading.Thread(target=bdist.run_worker, args=(coordinator.address, AUTHKEY))
+            worker.start()
+            self.assertTrue(len(coordinator.run(verbose=False)) > 0)
+            worker.join()
+
+if __name__ == "__main__":
+
+    test_suite = ut.TestLoader().loadTestsFromTestCase(BlockusDistributedTestCase)
+    res = ut.TextTestRunner(verbosity=2).run(test_suite)
+    num, errs, fails = res.testsRun, len(res.errors), len(res.failures)
+    print("score: %d of %d (%d errors, %d failures)" % (num - (errs+fails), num, errs, fails))
@@ -0,0 +1,125 @@
+"""
+Exact endgame solver
+
+Negamax with alpha-beta pruning over State or BitboardState, trying the
+largest pieces first (and the best move found before first), with a
+transposition table keyed by state.key. Values are final score differences,
+from the point of view of the player to move inside the search and of the
+max player outside it. The search gives up with SolverLimit after max_nodes
+positions or time_limit seconds.
+
+mcts.decide_action switches to it (through decide_action below) once
+playable_cells, an upper bound on the cells still to be claimed, is at most
+its endgame_cells argument.
+"""
+import time
+import numpy as np
+import mcts
+from polyomino import all_polyominoes
+
+EXACT, LOWER, UPPER = 0, 1, 2
+
+# cells in each polyomino, for move ordering
+piece_sizes = [int(polyomino.array.sum()) for polyomino in all_polyominoes]
+
+class SolverLimit(Exception):
+    pass
+
+def playable_cells(state):
+    # open cells that do not share a side with some player's own cells;
+    # every cell claimed from now on is one of them, and there are only fewer later
+    board = np.asarray(state.board)
+    open_cells = board == 0
+    playable = np.zeros(board.shape, dtype=bool)
+    for player in range(1, len(state.hands)+1):
+        own = board == player
+        sides = np.zeros(board.shape, dtype=bool)
+        sides[:, :-1] |= own[:, 1:]
+        sides[:, 1:] |= own[:, :-1]
+        sides[:-1, :] |= own[1:, :]
+        sides[1:, :] |= own[:-1, :]
+        playable |= open_cells & ~sides
+    return int(playable.sum())
+
+class Solver(object):
+    def __init__(self, max_nodes=None, time_limit=None):
+        # the transposition table is kept across solve calls
+        self.max_nodes = max_nodes
+        self.time_limit = time_limit
+        self.transpositions = {}
+        self.nodes = 0
+
+    def solve(self, state):
+        # (final score for the max player under perfect play, best action)
+        self.nodes, self.start = 0, time.time()
+        value = self.negamax(state, -np.inf, np.inf)
+        best = self.transpositions[state.key][2]
+        sign = 1 if state.is_max_players_turn() else -1
+        return sign * value, best
+
+    def ordered_actions(self, state, best=None):
+        actions = sorted(state.valid_actions(), key=lambda a: 0 if a is None else -piece_sizes[a[0].index])
+        if best in actions:
+            actions.remove(best)
+            actions.insert(0, best)
+        return actions
+
+    def negamax(self, state, alpha, beta):
+        self.nodes += 1
+        if self.max_nodes is not None and self.nodes > self.max_nodes: raise SolverLimit()
+        # checked at every position, as one costs milliseconds with the array State
+        if self.time_limit is not None and time.time() - self.start > self.time_limit: raise SolverLimit()
+
+        key = state.key
+        best = None
+        if key in self.transpositions:
+            value, flag, best = self.transpositions[key]
+            if flag == EXACT: return value
+            if flag == LOWER: alpha = max(alpha, value)
+            if flag == UPPER: beta = min(beta, value)
+            if alpha >= beta: return value
+
+        if state.is_leaf():
+            value = state.score_for_max_player()
+            if not state.is_max_players_turn(): value = -value
+            self.transpositions[key] = (value, EXACT, None)
+            return value
+
+        original_alpha, best_value = alpha, -np.inf
+        for action in self.ordered_actions(state, best):
+            value = -self.negamax(state.perform(action), -beta, -alpha)
+            if value > best_value: best_value, best = value, action
+            alpha = max(alpha, value)
+            if alpha >= beta: break
+
+        if best_value <= original_alpha: flag = UPPER
+        elif best_value >= beta: flag = LOWER
+        else: flag = EXACT
+        self.transpositions[key] = (best_value, flag, best)
+        return best_value
+
+def decide_action(state, choose_method=mcts.puct, max_nodes=10000, time_limit=None):
+    # (action_index, node) like mcts.decide_action, from an exact solve, or
+    # None if the solve hit its limits; the best child gets the exact value
+    # and one visit, the others their values or bounds from the alpha-beta
+    # search (never above the best)
+    solver = Solver(max_nodes, time_limit)
+    start = time.time()
+    try: value, best = solver.solve(state)
+    except SolverLimit: return None
+
+    node = mcts.Node(state, choose_method=choose_method)
+    a = state.valid_actions().index(best)
+    sign = 1 if state.is_max_players_turn() else -1
+    for c, child in enumerate(node.children()):
+        # the root is searched with a full window, so every child has an entry,
+        # for the player to move at the child
+        entry = solver.transpositions.get(child.state.key)
+        if c == a or entry is None: child_value = value
+        else:
+            child_value = entry[0] if child.state.is_max_players_turn() else -entry[0]
+            child_value = sign * min(sign * child_value, sign * value)
+        child.visit_count, child.score_total = 1, child_value
+    node.visit_count, node.score_total = 1, value
+    node.stats = {"solved": True, "value": value, "nodes": solver.nodes, "elapsed": time.time() - start}
+    return a, node
@@ -0,0 +1,77 @@
+"""
+This file is for test blockus_endgame.py
+"""
+import time
+import numpy as np
+import unittest as ut
+import blockus_game as bg
+import blockus_endgame as be
+import mcts
+
+def minimax(state):
+    # final score for the max player under perfect play, by brute force
+    if state.is_leaf(): return state.score_for_max_player()
+    values = [minimax(state.perform(action)) for action in state.valid_actions()]
+    return max(values) if state.is_max_players_turn() else min(values)
+
+def random_position(board_size, polyomino_size, num_moves, seed, backend="array"):
+    rng = np.random.RandomState(seed)
+    state = bg.initial_state(board_size, polyomino_size, backend=backend)
+    for _ in range(num_moves):
+        if state.is_leaf(): break
+        state = state.perform(state.sample_action(rng))
+    return state
+
+class BlockusEndgameTestCase(ut.TestCase):
+
+    def test_solve(self):
+        for board_size, polyomino_size, num_moves, seed in [(3, 3, 0, 0), (4, 3, 2, 1), (5, 3, 4, 2), (5, 3, 2, 2), (6, 4, 6, 2)]:
+            for backend in ["array", "bitboard"]:
+                state = random_position(board_size, polyomino_size, num_moves, seed, backend)
+                solver = be.Solver()
+                value, best = solver.solve(state)
+                self.assertTrue(value == minimax(state))
+                self.assertTrue(minimax(state.perform(best)) == value)
+                # the kept transposition table answers at once
+                self.assertTrue(solver.solve(state) == (value, best) and solver.nodes == 1)
+
+    def test_playable_cells(self):
+        state = bg.initial_state(board_size=4)
+        self.assertTrue(be.playable_cells(state) == 16)
+        state = state.perform(state.valid_actions()[0])
+        # the monomino at (0,0) claims one cell and blocks its two side neighbors for its owner only
+        self.assertTrue(be.playable_cells(state) == 15)
+
+    def test_limit(self):
+        state = random_position(6, 5, 0, 0)
+        with self.assertRaises(be.SolverLimit): be.Solver(max_nodes=100).solve(state)
+        self.assertTrue(be.decide_action(state, max_nodes=100) is None)
+
+    def test_decide_action(self):
+        state = random_position(5, 3, 2, 2, backend="bitboard")
+        value = minimax(state)
+        a, node = mcts.decide_action(state, 10, endgame_cells=25)
+        self.assertTrue(node.stats["solved"] and node.stats["value"] == value)
+        self.assertTrue(minimax(state.perform(state.valid_actions()[a])) == value)
+        self.assertTrue(node.get_score_estimates()[a] == node.get_score_estimates().max())
+        # above the threshold, or past the node limit, it searches as before
+        _, node = mcts.decide_action(state, 10, endgame_cells=be.playable_cells(state) - 1)
+        self.assertTrue("solved" not in node.stats)
+        _, node = mcts.decide_action(state, 10, endgame_cells=25, endgame_nodes=5)
+        self.assertTrue("solved" not in node.stats and node.stats["rollouts"] == 10)
+
+    def test_time_budget(self):
+        # a failed solve leaves the search only the rest of the budget
+        state = random_position(6, 5, 2, 0)
+        start = time.time()
+        a, node = mcts.decide_action(state, None, max_depth=4, time_budget=0.5, endgame_cells=36)
+        elapsed = time.time() - start
+        self.assertTrue("solved" not in node.stats and node.stats["rollouts"] > 0)
+        self.assertTrue(0.5 <= elapsed < 0.7 and node.stats["elapsed"] < 0.4)
+
+if __name__ == "__main__":
+
+    test_suite = ut.TestLoader().loadTestsFromTestCase(BlockusEndgameTestCase)
+    res = ut.TextTestRunner(verbosity=2).run(test_suite)
+    num, errs, fails = res.testsRun, len(res.errors), len(res.failures)
+    print("score: %d of %d (%d errors, %d failures)" % (num - (errs+fails), num, errs, fails))
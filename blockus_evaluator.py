@@ -0,0 +1,95 @@
+"""
+Memoized network evaluation for search
+
+CachedEvaluator sits between MCTS and a value net such as BlockusNet1: it
+maps states to net outputs, remembering them by state.key (the Zobrist key),
+so positions seen again, in later rollouts, moves or games, are not
+re-encoded or re-evaluated. Only the misses of each call go through
+blockus_data.encode_batch and the net, in one batch. The cache holds at most
+capacity outputs and evicts the least recently used one. PolicyEvaluator
+does the same for policy+value nets, and prior_puct turns it into a
+choose method.
+"""
+from collections import OrderedDict
+import numpy as np
+import torch as tr
+import blockus_data as bd
+import blockus_net as bn
+
+class CachedEvaluator(object):
+    def __init__(self, net, capacity=100000, extra_planes=False):
+        self.net = net
+        self.capacity = capacity
+        self.extra_planes = extra_planes
+        self.cache = OrderedDict()
+        self.hits, self.misses = 0, 0
+
+    def __call__(self, states):
+        # flat numpy array of net outputs, one per state
+        return np.array(self.lookup(states), dtype=float)
+
+    def lookup(self, states):
+        # cached results for states, computing the misses in one batch
+        keys = [state.key for state in states]
+        results = [None] * len(states)
+        missing = {}
+        for i, key in enumerate(keys):
+            if key in self.cache:
+                self.cache.move_to_end(key)
+                results[i] = self.cache[key]
+            else: missing.setdefault(key, []).append(i)
+        # a position repeated within one call is evaluated once, so counts as a hit after that
+        self.hits += len(states) - len(missing)
+        self.misses += len(missing)
+
+        if len(missing) > 0:
+            computed = self.compute([states[rows[0]] for rows in missing.values()])
+            for (key, rows), result in zip(missing.items(), computed):
+                for i in rows: results[i] = result
+                self.cache[key] = result
+            while len(self.cache) > self.capacity: self.cache.popitem(last=False)
+
+        return results
+
+    def compute(self, states):
+        with tr.no_grad():
+            x = bd.encode_batch(states, extra_planes=self.extra_planes)
+            return [float(y) for y in self.net(x).flatten()]
+
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total > 0 else 0.
+
+    def clear(self):
+        # forget all outputs, e.g. after the net's weights change
+        self.cache.clear()
+        self.hits, self.misses = 0, 0
+
+class PolicyEvaluator(CachedEvaluator):
+    # CachedEvaluator for a policy+value net such as blockus_net.BlockusNet2:
+    # each state maps to (priors, value), priors being the policy over the
+    # state's valid_actions, in their order, from one forward pass
+    def __call__(self, states):
+        return self.lookup(states)
+
+    def compute(self, states):
+        with tr.no_grad():
+            x = bd.encode_batch(states, extra_planes=self.extra_planes)
+            logits, values = self.net(x)
+        masks = tr.tensor(np.stack([state.valid_actions(form="mask") for state in states]))
+        policies = bn.masked_policy(logits, masks).numpy()
+        return [(policy[state.valid_actions(form="ids")], float(value))
+            for state, policy, value in zip(states, policies, values.flatten())]
+
+def prior_puct(evaluator, c=1.):
+    # choose method sampling children like mcts.puct, with the exploration
+    # term scaled by the evaluator's priors, so the net runs once per position
+    # rather than once per child
+    def choose(node):
+        priors, _ = evaluator([node.state])[0]
+        n = node.get_visit_counts()
+        q = node.get_score_estimates()
+        res = q + c * priors * np.sqrt(node.visit_count + 1) / (n + 1)
+        res = np.exp(res - res.max())
+        return node.children()[np.random.choice(len(res), p=res / res.sum())]
+    return choose
@@ -0,0 +1,78 @@
+"""
+This file is for test blockus_evaluator.py
+"""
+import numpy as np
+import torch as tr
+import unittest as ut
+import blockus_game as bg
+import blockus_data as bd
+import blockus_net as bn
+import blockus_evaluator as be
+import mcts
+
+class CountingNet(tr.nn.Module):
+    # BlockusNet1 that records the batch size of each call
+    def __init__(self, board_size):
+        super().__init__()
+        self.net = bn.BlockusNet1(board_size)
+        self.calls = []
+    def forward(self, x):
+        self.calls.append(len(x))
+        return self.net(x)
+
+class BlockusEvaluatorTestCase(ut.TestCase):
+
+    def test_cached_evaluator(self):
+        net = CountingNet(5)
+        evaluator = be.CachedEvaluator(net, capacity=4)
+        state = bg.initial_state(board_size=5)
+        children = [state.perform(action) for action in state.valid_actions()[:3]]
+        with tr.no_grad(): expected = net(bd.encode_batch(children)).flatten().numpy()
+        net.calls = []
+
+        y = evaluator(children + [children[0]])
+        self.assertTrue(np.allclose(y, list(expected) + [expected[0]]))
+        self.assertTrue(net.calls == [3]) # one batch, duplicates evaluated once
+        self.assertTrue((evaluator.hits, evaluator.misses) == (1, 3))
+
+        y = evaluator(children[::-1])
+        self.assertTrue(np.allclose(y, expected[::-1]))
+        self.assertTrue(net.calls == [3]) # all hits
+        self.assertTrue(evaluator.hit_rate() == 4 / 7)
+
+        # least recently used is evicted first
+        more = [state.perform(action) for action in state.valid_actions()[3:5]]
+        evaluator(more)
+        self.assertTrue(len(evaluator.cache) == 4)
+        self.assertTrue(children[2].key not in evaluator.cache)
+        self.assertTrue(children[0].key in evaluator.cache)
+
+        evaluator.clear()
+        self.assertTrue(len(evaluator.cache) == 0 and evaluator.hits == evaluator.misses == 0)
+
+    def test_policy_evaluator(self):
+        net = bn.BlockusNet2(5)
+        calls = []
+        net.register_forward_hook(lambda module, x, y: calls.append(len(x[0])))
+        evaluator = be.PolicyEvaluator(net)
+        state = bg.initial_state(board_size=5, backend="bitboard")
+        child = state.perform(state.valid_actions()[0])
+        (priors, value), (child_priors, _) = evaluator([state, child])
+        self.assertTrue(calls == [2])
+        self.assertTrue(len(priors) == len(state.valid_actions()) and np.isclose(priors.sum(), 1))
+        self.assertTrue(len(child_priors) == len(child.valid_actions()))
+        with tr.no_grad(): logits, expected = net(bd.encode_batch([state]))
+        self.assertTrue(np.isclose(value, expected.item()))
+        calls.pop()
+
+        # a search calls the net once per distinct position it chooses from
+        a, node = mcts.decide_action(state, 10, be.prior_puct(evaluator), 3)
+        self.assertTrue(0 <= a < len(state.valid_actions()))
+        self.assertTrue(sum(calls) == evaluator.misses)
+
+if __name__ == "__main__":
+
+    test_suite = ut.TestLoader().loadTestsFromTestCase(BlockusEvaluatorTestCase)
+    res = ut.TextTestRunner(verbosity=2).run(test_suite)
+    num, errs, fails = res.testsRun, len(res.errors), len(res.failures)
+    print("score: %d of %d (%d errors, %d failures)" % (num - (errs+fails), num, errs, fails))
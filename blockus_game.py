@@ -1,6 +1,8 @@
 import itertools as it
 import numpy as np
 from polyomino import polyominoes
+from blockus_zobrist import zobrist_key, get_keys
+from blockus_placements import get_table
 
 OPEN = "\u2591"
 RED = "\u2592"
@@ -24,6 +26,9 @@ class State(object):
         # cache valid actions
         self.valid_action_list = None
 
+        # Zobrist key, computed on first use, then passed on by perform
+        self._key = None
+
     def __str__(self):
 
         chars = np.array([OPEN, RED, BLUE])
@@ -56,6 +61,23 @@ class State(object):
     def copy(self):
          return State(self.size, self.turn, self.hands, self.plays, self.board)
 
+    @property
+    def key(self):
+        # Zobrist key of (board, hands, turn)
+        if self._key is None: self._key = zobrist_key(self)
+        return self._key
+
+    def child_key(self, action):
+        # key of perform(action), without building the new state
+        keys = get_keys(self.size)
+        key = self.key ^ keys.turns[self.turn-1] ^ keys.turns[self.turn % len(self.plays)]
+        if action is not None:
+            polyomino, p, row, col = action
+            cells = keys.cells[self.turn-1]
+            for dr, dc in polyomino.posed_offsets[p]: key ^= cells[(row+dr)*self.size + col+dc]
+            key ^= keys.pieces[self.turn-1][polyomino.index]
+        return key
+
     def is_leaf(self):
         if self.valid_actions() != [None]: return False
         else:
@@ -63,15 +85,22 @@ class State(object):
             other = self.perform(action=None)
             return other.valid_actions() == [None]
 
+    def has_any_move(self, player):
+        if player == self.turn: return self.valid_actions() != [None]
+        state = State(self.size, player, self.hands, self.plays, self.board)
+        return state.valid_actions() != [None]
+
     def score_for_max_player(self):
         return (self.board == 1).sum() - (self.board == 2).sum()
     
     def is_max_players_turn(self):
         return (self.turn == 1)
 
-    def valid_actions(self):
+    def valid_actions(self, form=None):
         # action is (polyomino, p, row, col) tuple
         # p is pose index
+        # form="ids" or "mask" gives integer action ids instead, see blockus_placements
+        if form is not None: return get_table(self.size).convert(self.valid_actions(), form)
         
         # use cached results if available
         if self.valid_action_list is not None:
@@ -151,6 +180,11 @@ class State(object):
         # return
         return actions
 
+    def sample_action(self, rng=np.random):
+        # one uniformly random action from valid_actions
+        actions = self.valid_actions()
+        return actions[rng.randint(len(actions))]
+
     def perform(self, action):
         # action=None skips current player
         new_state = self.copy()
@@ -164,9 +198,13 @@ class State(object):
             for dr, dc in polyomino.posed_offsets[p]:
                 new_state.board[row+dr, col+dc] = self.turn
 
+        # keep the key up to date once it is in use
+        if self._key is not None: new_state._key = self.child_key(action)
+
         return new_state
 
-def initial_state(board_size=10, polyomino_size=None):
+def initial_state(board_size=10, polyomino_size=None, backend="array"):
+    # backend is "array" (numpy move generation) or "bitboard"
     if polyomino_size is None: polyomino_size = len(polyominoes)
     hands = {}
     for player in [1, 2]:
@@ -174,6 +212,9 @@ def initial_state(board_size=10, polyomino_size=None):
         for size in range(polyomino_size):
             hands[player].extend(polyominoes[size])
     plays = {1: [], 2: []}
+    if backend == "bitboard":
+        import blockus_bitboard as bb
+        return bb.BitboardState(size=board_size, turn=1, hands=hands, plays=plays)
     return State(size=board_size, turn=1, hands=hands, plays=plays)
 
 if __name__ == "__main__":
@@ -0,0 +1,132 @@
+"""
+Shared batched inference server
+
+One process holds the value net and serves many searches: clients put
+encoded positions on a shared request queue, the server gathers requests
+until it has max_batch positions or the first of them has waited max_wait
+seconds, runs one forward pass and puts each client's rows on that client's
+response queue. The net is loaded from model_path, and reloaded whenever
+the file changes.
+
+A client is called like the net itself (tensor of encoded positions in,
+tensor of outputs out), so it can stand in for the net anywhere, e.g.
+    evaluator = blockus_evaluator.CachedEvaluator(server.clients[i])
+in an nn_puct-style choose method. Clients are made up front (num_clients)
+and handed to the search processes when those are started. A client raises
+RuntimeError when its batch fails in the forward pass, or when the server
+has stopped, e.g. because the model could not be loaded.
+"""
+import os
+import time
+import queue
+import multiprocessing as mp
+import numpy as np
+import torch as tr
+import blockus_net as bn
+
+class InferenceClient(object):
+    def __init__(self, client_id, requests, responses, stopped, poll_interval=1.):
+        # stopped is set by the server process when it exits
+        self.client_id = client_id
+        self.requests = requests
+        self.responses = responses
+        self.stopped = stopped
+        self.poll_interval = poll_interval
+        self.count = 0
+    def __call__(self, x):
+        # outputs for a batch of encoded positions, shaped like net(x)
+        self.count += 1
+        self.requests.put((self.client_id, self.count, np.asarray(x, dtype=np.float32)))
+        while True:
+            try: request_id, y = self.responses.get(timeout=self.poll_interval)
+            except queue.Empty:
+                if self.stopped.is_set(): raise RuntimeError("inference server has stopped")
+                continue
+            if request_id != self.count: continue
+            if isinstance(y, str): raise RuntimeError("inference server: %s" % y)
+            return tr.from_numpy(y)
+
+def load_net(make_net, board_size, model_path):
+    net = make_net(board_size)
+    net.load_state_dict(tr.load(model_path))
+    net.eval()
+    return net
+
+def model_version(model_path):
+    stat = os.stat(model_path)
+    return stat.st_mtime_ns, stat.st_size
+
+def serve(requests, responses, board_size, model_path, make_net, max_batch, max_wait, reload_interval,
+    counts, stopped):
+    # server process: counts holds (forward passes, positions, reloads)
+    try: batches(requests, responses, board_size, model_path, make_net, max_batch, max_wait,
+        reload_interval, counts)
+    finally: stopped.set() # clients waiting on a reply give up
+
+def batches(requests, responses, board_size, model_path, make_net, max_batch, max_wait, reload_interval, counts):
+    net, version = load_net(make_net, board_size, model_path), model_version(model_path)
+    checked = time.time()
+    while True:
+        request = requests.get()
+        if request is None: break
+        batch, rows, deadline = [request], len(request[2]), time.time() + max_wait
+        while rows < max_batch:
+            try: request = requests.get(timeout=max(deadline - time.time(), 0))
+            except queue.Empty: break
+            if request is None:
+                requests.put(None) # stop after this batch
+                break
+            batch.append(request)
+            rows += len(request[2])
+
+        if time.time() - checked >= reload_interval:
+            checked = time.time()
+            try:
+                if model_version(model_path) != version:
+                    net, version = load_net(make_net, board_size, model_path), model_version(model_path)
+                    counts[2] += 1
+            except (OSError, RuntimeError, EOFError): pass # file being written, try again later
+
+        try:
+            with tr.no_grad():
+                y = net(tr.from_numpy(np.concatenate([x for _, _, x in batch]))).numpy()
+        except (RuntimeError, ValueError) as error:
+            # e.g. positions of the wrong shape: the batch's clients get the
+            # error, the server goes on
+            for client_id, request_id, _ in batch: responses[client_id].put((request_id, str(error)))
+            continue
+        start = 0
+        for client_id, request_id, x in batch:
+            responses[client_id].put((request_id, y[start:start+len(x)]))
+            start += len(x)
+        counts[0] += 1
+        counts[1] += rows
+
+class InferenceServer(object):
+    def __init__(self, board_size, model_path=None, num_clients=1, max_batch=64, max_wait=0.002,
+        reload_interval=1., make_net=bn.BlockusNet1):
+        # model_path defaults to model%d.pth as written by blockus_net
+        if model_path is None: model_path = "model%d.pth" % board_size
+        self.requests = mp.Queue()
+        self.stopped = mp.Event()
+        responses = [mp.Queue() for _ in range(num_clients)]
+        self.clients = [InferenceClient(c, self.requests, responses[c], self.stopped) for c in range(num_clients)]
+        self.counts = mp.Array("l", 3)
+        self.process = mp.Process(target=serve, daemon=True, args=(self.requests, responses, board_size,
+            model_path, make_net, max_batch, max_wait, reload_interval, self.counts, self.stopped))
+        self.process.start()
+
+    def stats(self):
+        batches, positions, reloads = self.counts[:]
+        return {"batches": batches, "positions": positions, "reloads": reloads,
+            "mean_batch": positions / batches if batches > 0 else 0.}
+
+    def close(self):
+        self.requests.put(None)
+        self.process.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
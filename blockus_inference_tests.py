@@ -0,0 +1,108 @@
+"""
+This file is for test blockus_inference.py
+"""
+import os
+import time
+import tempfile
+import multiprocessing as mp
+import numpy as np
+import torch as tr
+import unittest as ut
+import blockus_game as bg
+import blockus_data as bd
+import blockus_net as bn
+import blockus_evaluator as be
+import blockus_inference as bi
+import mcts
+
+def save_net(path, bias):
+    net = bn.BlockusNet1(5)
+    net[1].weight.data[:] = 0.01
+    net[1].bias.data[:] = bias
+    tr.save(net.state_dict(), path)
+    return net
+
+def search(client, results):
+    # nn_puct-style search through the server
+    evaluator = be.CachedEvaluator(client)
+    def choose(node):
+        y = tr.tensor(evaluator([child.state for child in node.children()]))
+        return node.children()[np.random.choice(len(y), p=tr.softmax(y, dim=0).numpy())]
+    state = bg.initial_state(board_size=5)
+    a, node = mcts.decide_action(state, 20, choose, 4)
+    states = [child.state for child in node.children()]
+    results.put((client.client_id, client(bd.encode_batch(states)).numpy()))
+
+class BlockusInferenceTestCase(ut.TestCase):
+
+    def test_concurrent_clients(self):
+        with tempfile.TemporaryDirectory() as path:
+            model_path = os.path.join(path, "model5.pth")
+            net = save_net(model_path, 0.)
+            with bi.InferenceServer(5, model_path, num_clients=3, max_wait=0.01) as server:
+                results = mp.Queue()
+                searches = [mp.Process(target=search, args=(client, results)) for client in server.clients]
+                for s in searches: s.start()
+                outputs = [results.get() for _ in searches]
+                for s in searches: s.join()
+                stats = server.stats()
+
+            state = bg.initial_state(board_size=5)
+            with tr.no_grad():
+                expected = net(bd.encode_batch([state.perform(a) for a in state.valid_actions()])).numpy()
+            self.assertTrue(sorted(c for c, _ in outputs) == [0, 1, 2])
+            for _, y in outputs: self.assertTrue(np.allclose(y, expected))
+            self.assertTrue(stats["batches"] >= 1 and stats["positions"] >= 3*len(expected))
+
+    def test_batching(self):
+        with tempfile.TemporaryDirectory() as path:
+            model_path = os.path.join(path, "model5.pth")
+            save_net(model_path, 0.)
+            x = tr.zeros(2, 3, 5, 5)
+            with bi.InferenceServer(5, model_path, num_clients=4, max_batch=8, max_wait=0.5) as server:
+                # requests queued before the server reads them are served together
+                for client in server.clients:
+                    client.count += 1
+                    client.requests.put((client.client_id, client.count, x.numpy()))
+                for client in server.clients:
+                    request_id, y = client.responses.get()
+                    self.assertTrue(request_id == client.count and y.shape == (2, 1))
+                self.assertTrue(server.stats()["batches"] == 1)
+                self.assertTrue(server.stats()["mean_batch"] == 8)
+
+    def test_hot_reload(self):
+        with tempfile.TemporaryDirectory() as path:
+            model_path = os.path.join(path, "model5.pth")
+            save_net(model_path, 0.)
+            x = tr.zeros(1, 3, 5, 5)
+            with bi.InferenceServer(5, model_path, reload_interval=0.) as server:
+                client = server.clients[0]
+                self.assertTrue(tr.allclose(client(x), tr.zeros(1, 1)))
+                time.sleep(0.01) # a new modification time
+                save_net(model_path, 1.)
+                self.assertTrue(tr.allclose(client(x), tr.ones(1, 1)))
+                self.assertTrue(server.stats()["reloads"] == 1)
+
+    def test_server_errors(self):
+        with tempfile.TemporaryDirectory() as path:
+            # the batch fails, the server goes on
+            model_path = os.path.join(path, "model5.pth")
+            net = save_net(model_path, 0.)
+            with bi.InferenceServer(5, model_path) as server:
+                client = server.clients[0]
+                with self.assertRaises(RuntimeError): client(tr.zeros(2, 3, 4, 4))
+                x = bd.encode_batch([bg.initial_state(board_size=5)])
+                with tr.no_grad(): self.assertTrue(tr.allclose(client(x), net(x)))
+
+            # the server cannot start
+            server = bi.InferenceServer(5, os.path.join(path, "missing.pth"))
+            server.clients[0].poll_interval = 0.1
+            with self.assertRaises(RuntimeError): server.clients[0](x)
+            server.process.join()
+
+if __name__ == "__main__":
+
+    test_suite = ut.TestLoader().loadTestsFromTestCase(BlockusInferenceTestCase)
+    res = ut.TextTestRunner(verbosity=2).run(test_suite)
+    num, errs, fails = res.testsRun, len(res.errors), len(res.failures)
+    print("score: %d of %d (%d errors, %d failures)" % (num - (errs+fails), num, errs, fails))
@@ -7,9 +7,9 @@
 // Copyright @ 2020 Chen. All rights reserved. //
 /////////////////////////////////////////////////
 """
-import numpy as np
 import torch as tr
 from torch.nn import Sequential, Conv2d, Linear, Flatten, LeakyReLU, Tanh
+from blockus_placements import get_table
 
 def BlockusNet1(board_size):
     model = Sequential(
@@ -18,6 +18,29 @@ def BlockusNet1(board_size):
     )
     return model
 
+class BlockusNet2(tr.nn.Module):
+    # policy+value net: a convolutional trunk, a policy head of logits over
+    # the integer action space of blockus_placements (every placement plus
+    # pass) and a value head like BlockusNet1's
+    def __init__(self, board_size, channels=3, width=32):
+        super().__init__()
+        self.num_actions = get_table(board_size).num_actions
+        self.trunk = Sequential(
+            Conv2d(channels, width, 3, padding=1), LeakyReLU(),
+            Conv2d(width, width, 3, padding=1), LeakyReLU(),
+            Flatten())
+        self.policy = Linear(width*board_size*board_size, self.num_actions)
+        self.value = Linear(width*board_size*board_size, 1)
+
+    def forward(self, x):
+        # (policy logits, value) for a batch of encoded states
+        h = self.trunk(x)
+        return self.policy(h), self.value(h)
+
+def masked_policy(logits, masks):
+    # softmax over the legal actions only, masks from valid_actions(form="mask")
+    return tr.softmax(logits.masked_fill(~masks, float("-inf")), dim=-1)
+
 def calculate_loss(net, x, y_targ):
     output = net(x)
     e = tr.sum((output-y_targ)*(output-y_targ))
@@ -33,41 +56,9 @@ def optimization_step(optimizer, net, x, y_targ):
 if __name__ == "__main__":
 
     board_size = 6
-    net = BlockusNet1(board_size=board_size)
-    print(net)
-
-    import pickle as pk
-    with open("data%d.pkl" % board_size,"rb") as f: (x, y_targ) = pk.load(f)
-
-    # Optimization loop
-    optimizer = tr.optim.Adam(net.parameters())
-    train_loss, test_loss = [], []
-    shuffle = np.random.permutation(range(len(x)))
-    split = 10
-    train, test = shuffle[:-split], shuffle[-split:]
-    for epoch in range(5000):
-        y_train, e_train = optimization_step(optimizer, net, x[train], y_targ[train])
-        y_test, e_test = calculate_loss(net, x[test], y_targ[test])
-        if epoch % 10 == 0: print("%d: %f (%f)" % (epoch, e_train.item(), e_test.item()))
-        train_loss.append(e_train.item() / (len(shuffle)-split))
-        test_loss.append(e_test.item() / split)
-    
-    tr.save(net.state_dict(), "model%d.pth" % board_size)
-    
-    import matplotlib.pyplot as pt
-    pt.plot(train_loss,'b-')
-    pt.plot(test_loss,'r-')
-    pt.legend(["Train","Test"])
-    pt.xlabel("Iteration")
-    pt.ylabel("Average Loss")
-    pt.show()
-    
-    pt.plot(y_train.detach().numpy(), y_targ[train].detach().numpy(),'bo')
-    pt.plot(y_test.detach().numpy(), y_targ[test].detach().numpy(),'ro')
-    pt.legend(["Train","Test"])
-    pt.xlabel("Actual output")
-    pt.ylabel("Target output")
-    pt.show()
-
-    
+    print(BlockusNet1(board_size=board_size))
 
+    # streams dataset6 (see blockus_data), writes model6.pth, resumes from
+    # checkpoint6.pth and logs losses and samples/sec to train6.log
+    import blockus_train as bt
+    bt.train("dataset%d" % board_size, board_size, verbose=True)
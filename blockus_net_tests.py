@@ -5,6 +5,7 @@ import numpy as np
 import torch as tr
 import unittest as ut
 import blockus_net as bn
+import blockus_placements as bp
 
 class BlockusNetTestCase(ut.TestCase):
 
@@ -46,6 +47,21 @@ class BlockusNetTestCase(ut.TestCase):
         expected_sum = tr.tensor(87616.000000)
         self.assertTrue(tr.allclose(actual_sum, expected_sum))
         
+    def test_blockus_net2(self):
+        net = bn.BlockusNet2(board_size=5)
+        self.assertTrue(net.num_actions == len(bp.get_table(5)) + 1)
+        logits, values = net(tr.zeros((4,3,5,5)))
+        self.assertTrue(logits.shape == (4, net.num_actions))
+        self.assertTrue(values.shape == (4, 1))
+
+    def test_masked_policy(self):
+        logits = tr.tensor([[1., 2., 3.], [0., 0., 0.]])
+        masks = tr.tensor([[True, False, True], [False, True, False]])
+        policy = bn.masked_policy(logits, masks)
+        self.assertTrue(tr.allclose(policy.sum(dim=1), tr.ones(2)))
+        self.assertTrue((policy[~masks] == 0).all())
+        self.assertTrue(tr.allclose(policy[1], tr.tensor([0., 1., 0.])))
+
 if __name__ == "__main__":    
     
     test_suite = ut.TestLoader().loadTestsFromTestCase(BlockusNetTestCase)
@@ -0,0 +1,154 @@
+"""
+Placement table for a given board size
+
+Every (polyomino, pose, row, col) that lies fully on a size x size board is a
+placement with an integer id. For each placement the table holds bitmasks
+(bit row*size + col, as in blockus_bitboard) of the cells it covers, the cells
+sharing a side with it and the cells sharing only a corner with it, plus a
+reverse index from each board cell to the placements that cover it. For each
+pose it holds the mask of upper-left cells where it fits and the bit offsets of
+its cells, so move generation is a few masks ANDed over these candidates. The
+table depends only on board size, so it is built once and shared by every state.
+"""
+import os
+import pickle as pk
+import numpy as np
+from polyomino import all_polyominoes
+
+class PlacementTable(object):
+    def __init__(self, size):
+        self.size = size
+
+        # placement attributes, indexed by placement id
+        # ids are ordered by (piece index, pose, row, col)
+        self.piece, self.pose, self.row, self.col = [], [], [], []
+        self.cover, self.sides, self.diagonals = [], [], []
+
+        # placement id for each (piece index, pose, row, col)
+        self.ids = {}
+
+        # (fits, offsets, ids) for each (piece index, pose):
+        # fits is the mask of upper-left cells where the pose lies on the board,
+        # offsets are the bit offsets of the pose cells from its upper-left,
+        # ids maps each upper-left bit index in fits to its placement id
+        self.poses = {}
+
+        # placement ids covering each cell
+        self.by_cell = [[] for _ in range(size*size)]
+
+        for polyomino in all_polyominoes:
+            for p, posed_offsets in enumerate(polyomino.posed_offsets):
+                offsets = [int(dr*size + dc) for dr, dc in posed_offsets]
+                fits, ids = 0, {}
+                height = 1 + max(dr for dr, _ in posed_offsets)
+                width = 1 + max(dc for _, dc in posed_offsets)
+                for row in range(size - height + 1):
+                    for col in range(size - width + 1):
+                        cells = [(row+dr, col+dc) for dr, dc in posed_offsets]
+                        fits |= 1 << (row*size + col)
+                        ids[row*size + col] = self.add(polyomino.index, p, row, col, cells)
+                self.poses[polyomino.index, p] = (fits, offsets, ids)
+
+        self.make_actions()
+
+    def add(self, piece, pose, row, col, cells):
+        size = self.size
+        def mask(cells):
+            bits = 0
+            for r, c in cells:
+                if 0 <= r < size and 0 <= c < size: bits |= 1 << int(r*size + c)
+            return bits
+
+        cover = mask(cells)
+        sides = mask([(r+dr, c+dc) for r, c in cells
+            for dr, dc in [(-1, 0), (1, 0), (0, -1), (0, 1)]]) & ~cover
+        diagonals = mask([(r+dr, c+dc) for r, c in cells
+            for dr, dc in [(-1, -1), (-1, 1), (1, -1), (1, 1)]]) & ~(cover | sides)
+
+        k = len(self.piece)
+        self.piece.append(piece)
+        self.pose.append(pose)
+        self.row.append(row)
+        self.col.append(col)
+        self.cover.append(cover)
+        self.sides.append(sides)
+        self.diagonals.append(diagonals)
+        self.ids[piece, pose, row, col] = k
+        for r, c in cells: self.by_cell[r*size + c].append(k)
+        return k
+
+    def make_actions(self):
+        # action tuples for each placement, as returned by State.valid_actions
+        self.actions = [
+            (all_polyominoes[piece], pose, row, col)
+            for piece, pose, row, col in zip(self.piece, self.pose, self.row, self.col)]
+
+    def placement_id(self, action):
+        polyomino, pose, row, col = action
+        return self.ids[polyomino.index, pose, row, col]
+
+    # integer action space: placement ids, then pass_id for the None action
+    @property
+    def pass_id(self):
+        return len(self.piece)
+
+    @property
+    def num_actions(self):
+        return len(self.piece) + 1
+
+    def action_id(self, action):
+        return self.pass_id if action is None else self.placement_id(action)
+
+    def action(self, action_id):
+        return None if action_id == self.pass_id else self.actions[action_id]
+
+    def action_ids(self, actions):
+        return np.array([self.action_id(action) for action in actions], dtype=np.int64)
+
+    def action_mask(self, actions):
+        mask = np.zeros(self.num_actions, dtype=bool)
+        mask[self.action_ids(actions)] = True
+        return mask
+
+    def convert(self, actions, form):
+        # actions as an id array (form="ids") or a mask over all ids (form="mask")
+        if form == "ids": return self.action_ids(actions)
+        if form == "mask": return self.action_mask(actions)
+        raise ValueError("form must be 'ids' or 'mask', not %r" % (form,))
+
+    def __len__(self):
+        return len(self.piece)
+
+    def __getstate__(self):
+        # polyomino objects are module globals, so rebuild actions on load
+        state = dict(self.__dict__)
+        del state["actions"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.make_actions()
+
+_tables = {}
+
+def get_table(board_size, cache_dir=None):
+    # in-memory cache, optionally backed by a pickle file in cache_dir
+    if board_size in _tables: return _tables[board_size]
+
+    table = None
+    if cache_dir is not None:
+        path = os.path.join(cache_dir, "placements%d.pkl" % board_size)
+        if os.path.exists(path):
+            with open(path, "rb") as f: table = pk.load(f)
+            if len(table.poses) != sum(len(p.poses) for p in all_polyominoes): table = None
+
+    if table is None:
+        table = PlacementTable(board_size)
+        if cache_dir is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+            tmp = path + ".tmp"
+            with open(tmp, "wb") as f: pk.dump(table, f)
+            os.replace(tmp, path)
+
+    _tables[board_size] = table
+    return table
@@ -0,0 +1,63 @@
+"""
+This file is for test blockus_placements.py
+"""
+import os
+import tempfile
+import unittest as ut
+import blockus_game as bg
+import blockus_placements as bp
+from polyomino import polyominoes
+
+class BlockusPlacementsTestCase(ut.TestCase):
+
+    def test_masks(self):
+        table = bp.PlacementTable(3)
+        domino = polyominoes[1][0]
+        # horizontal domino in the middle row, left column
+        k = table.placement_id((domino, 0, 1, 0))
+        self.assertTrue(table.cover[k] == (1 << 3) | (1 << 4))
+        self.assertTrue(table.sides[k] == (1 << 0) | (1 << 1) | (1 << 5) | (1 << 6) | (1 << 7))
+        self.assertTrue(table.diagonals[k] == (1 << 2) | (1 << 8))
+        self.assertTrue(table.actions[k] == (domino, 0, 1, 0))
+
+    def test_by_cell(self):
+        table = bp.PlacementTable(2)
+        for cell in range(4):
+            for k in table.by_cell[cell]:
+                self.assertTrue(table.cover[k] & (1 << cell))
+        # monomino, 2 dominoes, 3 L-trominoes and the square cover each cell
+        self.assertTrue(len(table.by_cell[0]) == 1 + 2 + 3 + 1)
+        # 4 monomino, 2+2 domino, 4 L-tromino and 1 square placements on 2x2
+        self.assertTrue(len(table) == 4 + 4 + 4 + 1)
+
+    def test_action_ids(self):
+        table = bp.get_table(4)
+        state = bg.initial_state(board_size=4)
+        actions = state.valid_actions()
+        ids = state.valid_actions(form="ids")
+        self.assertTrue([table.action(k) for k in ids] == actions)
+        mask = state.valid_actions(form="mask")
+        self.assertTrue(mask.shape == (table.num_actions,) and mask.sum() == len(actions))
+        self.assertTrue(mask[ids].all())
+        # passing has its own id
+        self.assertTrue(table.action_ids([None]).tolist() == [table.pass_id] == [len(table)])
+        self.assertTrue(table.action(table.pass_id) is None)
+
+    def test_get_table(self):
+        self.assertTrue(bp.get_table(4) is bp.get_table(4))
+        with tempfile.TemporaryDirectory() as cache_dir:
+            bp._tables.pop(5, None) # built by other tests in the same run
+            table = bp.get_table(5, cache_dir)
+            self.assertTrue(os.path.exists(os.path.join(cache_dir, "placements5.pkl")))
+            del bp._tables[5]
+            loaded = bp.get_table(5, cache_dir)
+            self.assertTrue(loaded is not table)
+            self.assertTrue(loaded.cover == table.cover)
+            self.assertTrue(loaded.actions == table.actions)
+
+if __name__ == "__main__":    
+    
+    test_suite = ut.TestLoader().loadTestsFromTestCase(BlockusPlacementsTestCase)
+    res = ut.TextTestRunner(verbosity=2).run(test_suite)
+    num, errs, fails = res.testsRun, len(res.errors), len(res.failures)
+    print("score: %d of %d (%d errors, %d failures)" % (num - (errs+fails), num, errs, fails))
@@ -0,0 +1,102 @@
+"""
+Mini-batch trainer for the value nets in blockus_net
+
+Trains on a blockus_dataset directory, streaming shuffled mini-batches from
+the memory-mapped shards through DataLoader worker processes. A fixed
+fraction of rows is held out and evaluated every eval_every steps. Model and
+optimizer state are checkpointed atomically every checkpoint_every steps,
+and train picks up from the checkpoint when one exists. The checkpoint keeps
+the held out rows, so rows appended to the dataset since go to training only. Progress goes to a
+log file, one JSON object per line.
+"""
+import os
+import json
+import time
+import itertools as it
+import numpy as np
+import torch as tr
+import blockus_net as bn
+import blockus_dataset as bds
+
+def split(num_rows, test_fraction=0.1, seed=0):
+    # (train, test) row indices, the same on every call for the same num_rows
+    order = np.random.RandomState(seed).permutation(num_rows)
+    num_test = int(round(num_rows * test_fraction))
+    return np.sort(order[num_test:]), np.sort(order[:num_test])
+
+def atomic_save(obj, path):
+    tmp = path + ".tmp"
+    tr.save(obj, tmp)
+    os.replace(tmp, path)
+
+def evaluate(net, dataset, rows, batch_size=1024):
+    # mean squared error over the given rows
+    total = 0.
+    with tr.no_grad():
+        for b in range(0, len(rows), batch_size):
+            x, y_targ = dataset.batch(rows[b:b+batch_size])
+            _, e = bn.calculate_loss(net, x, y_targ)
+            total += e.item()
+    return total / max(len(rows), 1)
+
+def train(data_path, board_size=6, num_steps=5000, batch_size=64, learning_rate=1e-3,
+    test_fraction=0.1, eval_every=100, checkpoint_every=500, num_workers=2, seed=0,
+    model_path=None, checkpoint_path=None, log_path=None, make_net=bn.BlockusNet1, verbose=False):
+    # paths default to model%d.pth, checkpoint%d.pth and train%d.log for board_size
+    # returns the trained net
+    if model_path is None: model_path = "model%d.pth" % board_size
+    if checkpoint_path is None: checkpoint_path = "checkpoint%d.pth" % board_size
+    if log_path is None: log_path = "train%d.log" % board_size
+
+    dataset = bds.ShardedDataset(data_path)
+    net = make_net(board_size)
+    optimizer = tr.optim.Adam(net.parameters(), lr=learning_rate)
+    step, epoch, batch = 0, 0, 0 # batch counts batches done in the current epoch
+
+    if os.path.exists(checkpoint_path):
+        checkpoint = tr.load(checkpoint_path)
+        net.load_state_dict(checkpoint["net"])
+        optimizer.load_state_dict(checkpoint["optimizer"])
+        step, epoch, batch = checkpoint["step"], checkpoint["epoch"], checkpoint["batch"]
+        test_rows = np.array(checkpoint["test_rows"], dtype=np.int64)
+        train_rows = np.setdiff1d(np.arange(len(dataset)), test_rows)
+    else: train_rows, test_rows = split(len(dataset), test_fraction, seed)
+
+    def save():
+        atomic_save({"net": net.state_dict(), "optimizer": optimizer.state_dict(),
+            "step": step, "epoch": epoch, "batch": batch, "test_rows": test_rows.tolist()}, checkpoint_path)
+        atomic_save(net.state_dict(), model_path)
+
+    stream = bds.BatchStream(data_path, batch_size, seed=seed, indices=train_rows)
+    loader = tr.utils.data.DataLoader(stream, batch_size=None, num_workers=num_workers)
+    with open(log_path, "a") as log:
+        start, samples, train_loss = time.time(), 0, 0.
+        while step < num_steps:
+            # the stream shuffles by epoch, skip what was done before a resume
+            stream.set_epoch(epoch)
+            for x, y_targ in it.islice(loader, batch, None):
+                _, e = bn.optimization_step(optimizer, net, x, y_targ)
+                step, batch = step + 1, batch + 1
+                samples += len(x)
+                train_loss += e.item()
+
+                if step % eval_every == 0 or step == num_steps:
+                    elapsed = time.time() - start
+                    record = {"step": step, "epoch": epoch,
+                        "train_loss": train_loss / max(samples, 1),
+                        "test_loss": evaluate(net, dataset, test_rows),
+                        "samples_per_sec": samples / max(elapsed, 1e-9)}
+                    log.write(json.dumps(record) + "\n")
+                    log.flush()
+                    if verbose: print("%(step)d: %(train_loss)f (%(test_loss)f), %(samples_per_sec).0f samples/sec" % record)
+                    start, samples, train_loss = time.time(), 0, 0.
+
+                if step % checkpoint_every == 0: save()
+                if step == num_steps: break
+            else: epoch, batch = epoch + 1, 0
+            if len(train_rows) == 0: break
+    save()
+    return net
+
+def read_log(log_path):
+    with open(log_path) as f: return [json.loads(line) for line in f]
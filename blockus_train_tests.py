@@ -0,0 +1,65 @@
+"""
+This file is for test blockus_train.py
+"""
+import os
+import tempfile
+import numpy as np
+import torch as tr
+import unittest as ut
+import blockus_dataset as bds
+import blockus_train as bt
+
+def make_dataset(path, num_rows=200, board_size=3, seed=0):
+    # targets are a linear function of the inputs, so the net can fit them
+    rng = np.random.RandomState(seed)
+    inputs = rng.randint(2, size=(num_rows, 3, board_size, board_size))
+    weights = rng.randn(3*board_size*board_size) / 10
+    targets = inputs.reshape(num_rows, -1) @ weights
+    with bds.ShardWriter(path, board_size, shard_size=32) as writer: writer.append(inputs, targets)
+
+class BlockusTrainTestCase(ut.TestCase):
+
+    def test_split(self):
+        train, test = bt.split(100, 0.1, seed=3)
+        self.assertTrue(len(train) == 90 and len(test) == 10)
+        self.assertTrue(sorted(np.concatenate([train, test])) == list(range(100)))
+        self.assertTrue((bt.split(100, 0.1, seed=3)[1] == test).all())
+
+    def test_train_and_resume(self):
+        with tempfile.TemporaryDirectory() as path:
+            data_path = os.path.join(path, "data")
+            make_dataset(data_path)
+            paths = {name: os.path.join(path, name) for name in ["model_path", "checkpoint_path", "log_path"]}
+
+            tr.manual_seed(0)
+            bt.train(data_path, 3, num_steps=30, batch_size=16, eval_every=10, checkpoint_every=10,
+                num_workers=0, learning_rate=0.01, **paths)
+            log = bt.read_log(paths["log_path"])
+            self.assertTrue([record["step"] for record in log] == [10, 20, 30])
+            self.assertTrue(log[-1]["test_loss"] < log[0]["test_loss"])
+            self.assertTrue(all(record["samples_per_sec"] > 0 for record in log))
+            checkpoint = tr.load(paths["checkpoint_path"])
+            self.assertTrue(checkpoint["step"] == 30 and checkpoint["epoch"] == 2)
+            self.assertFalse(os.path.exists(paths["checkpoint_path"] + ".tmp"))
+
+            # rows appended before resuming are all for training, the held out rows stay
+            test_rows = checkpoint["test_rows"]
+            self.assertTrue(test_rows == bt.split(200, 0.1, seed=0)[1].tolist())
+            with bds.ShardWriter(data_path) as writer:
+                writer.append(np.zeros((40, 3, 3, 3)), np.zeros(40))
+
+            # resuming continues from step 30, with two loader workers
+            net = bt.train(data_path, 3, num_steps=50, batch_size=16, eval_every=10, checkpoint_every=10,
+                num_workers=2, learning_rate=0.01, **paths)
+            log = bt.read_log(paths["log_path"])
+            self.assertTrue([record["step"] for record in log] == [10, 20, 30, 40, 50])
+            self.assertTrue(tr.load(paths["checkpoint_path"])["test_rows"] == test_rows)
+            saved = tr.load(paths["model_path"])
+            for name, param in net.state_dict().items(): self.assertTrue(tr.equal(saved[name], param))
+
+if __name__ == "__main__":
+
+    test_suite = ut.TestLoader().loadTestsFromTestCase(BlockusTrainTestCase)
+    res = ut.TextTestRunner(verbosity=2).run(test_suite)
+    num, errs, fails = res.testsRun, len(res.errors), len(res.failures)
+    print("score: %d of %d (%d errors, %d failures)" % (num - (errs+fails), num, errs, fails))
@@ -0,0 +1,155 @@
+"""
+N games of Blockus stepped together
+
+VecEnv holds N games as stacked NumPy arrays: each player's claimed cells and
+hand, whose turn it is, and the legal-move mask of the player to move, over
+the integer action space of blockus_placements (placement ids, then pass).
+The masks of all games come from two matrix products with the table's cover
+matrix: the cells each placement would cover must miss every blocked cell
+(claimed, or sharing a side with the mover's own) and hit an anchor (sharing
+only a corner with the mover's own, or the start corner). A game is over
+when neither player has a placement left, as in State.is_leaf.
+"""
+import numpy as np
+import torch as tr
+import blockus_game as bg
+import blockus_placements as bp
+import blockus_bitboard as bb
+from polyomino import polyominoes, all_polyominoes
+
+class VecEnv(object):
+    def __init__(self, num_games, board_size=6, polyomino_size=None):
+        self.num_games = num_games
+        self.size = board_size
+        self.table = table = bp.get_table(board_size)
+        self.num_actions = table.num_actions
+        cells = board_size * board_size
+
+        # placement id -> covered cells (as 0/1 columns for the products) and piece index
+        cover = np.zeros((cells, len(table)), dtype=np.float32)
+        for k, bits in enumerate(table.cover):
+            cover[bb.bit_indices(bits), k] = 1
+        self.cover = cover
+        self.cover_bool = cover.T.astype(bool)
+        self.piece = np.array(table.piece, dtype=np.int64)
+
+        if polyomino_size is None: polyomino_size = len(polyominoes)
+        self.polyomino_size = polyomino_size
+        self.initial_hand = np.zeros(len(all_polyominoes), dtype=bool)
+        for size in range(polyomino_size):
+            for polyomino in polyominoes[size]: self.initial_hand[polyomino.index] = True
+
+        self.starts = np.zeros((2, board_size, board_size), dtype=bool)
+        self.starts[0, 0, 0] = True
+        self.starts[1, -1, -1] = True
+
+        # per game: cells (game, player-1, row, col), hands (game, player-1, piece index),
+        # turn (1 or 2), done, legal mask of the player to move
+        self.cells = np.zeros((num_games, 2, board_size, board_size), dtype=bool)
+        self.hands = np.zeros((num_games, 2, len(all_polyominoes)), dtype=bool)
+        self.turn = np.ones(num_games, dtype=np.int64)
+        self.done = np.zeros(num_games, dtype=bool)
+        self.mask = np.zeros((num_games, self.num_actions), dtype=bool)
+        self.plays = [[] for _ in range(num_games)] # action ids played, for to_state
+        self.reset()
+
+    def reset(self, games=None):
+        # start new games at the given indices (a bool mask or index array), all by default
+        if games is None: games = np.arange(self.num_games)
+        games = np.flatnonzero(games) if np.asarray(games).dtype == bool else np.asarray(games)
+        self.cells[games] = False
+        self.hands[games] = self.initial_hand
+        self.turn[games] = 1
+        self.done[games] = False
+        for g in games: self.plays[g] = []
+        self.update_masks(games)
+
+    def placement_masks(self, games, players):
+        # (len(games), num placements) legal placements of the given players (1 or 2)
+        i = players - 1
+        own = self.cells[games, i]
+        occupied = self.cells[games].any(axis=1)
+        sides = shift_sides(own)
+        anchors = (shift_corners(own) | self.starts[i]) & ~sides & ~occupied
+        blocked = (occupied | sides).reshape(len(games), -1).astype(np.float32)
+        anchors = anchors.reshape(len(games), -1).astype(np.float32)
+        legal = (blocked @ self.cover == 0) & (anchors @ self.cover > 0)
+        return legal & self.hands[games, i][:, self.piece]
+
+    def update_masks(self, games):
+        # legal masks of the players to move, and done where neither can place
+        if len(games) == 0: return
+        placements = self.placement_masks(games, self.turn[games])
+        stuck = ~placements.any(axis=1)
+        if stuck.any():
+            others = games[stuck]
+            other_stuck = ~self.placement_masks(others, 3 - self.turn[others]).any(axis=1)
+            self.done[others[other_stuck]] = True
+        self.mask[games, :-1] = placements
+        self.mask[games, -1] = stuck
+
+    def step(self, actions):
+        # play one action id per game (ignored for finished games), returns done
+        actions = np.asarray(actions)
+        games = np.flatnonzero(~self.done)
+        actions = actions[games]
+        if not self.mask[games, actions].all(): raise ValueError("illegal action")
+
+        places = actions != self.table.pass_id
+        g, k = games[places], actions[places]
+        i = self.turn[g] - 1
+        self.cells[g, i] |= self.cover_bool[k].reshape(-1, self.size, self.size)
+        self.hands[g, i, self.piece[k]] = False
+        for game, action in zip(games, actions): self.plays[game].append(int(action))
+
+        self.turn[games] = 3 - self.turn[games]
+        self.update_masks(games)
+        return self.done.copy()
+
+    def sample_actions(self, rng=np.random, logits=None):
+        # one legal action id per game, uniformly at random, or sampled from
+        # policy logits (num_games, num_actions) by the Gumbel-max trick
+        noise = rng.random_sample(self.mask.shape)
+        if logits is None: scores = noise
+        else: scores = np.asarray(logits) - np.log(-np.log(noise + 1e-20) + 1e-20)
+        return np.where(self.mask, scores, -np.inf).argmax(axis=1)
+
+    def scores(self):
+        # score_for_max_player of every game
+        counts = self.cells.sum(axis=(2, 3))
+        return counts[:, 0] - counts[:, 1]
+
+    def boards(self):
+        # (num_games, size, size) boards as in State.board
+        return self.cells[:, 0] * 1 + self.cells[:, 1] * 2
+
+    def encode(self, out=None):
+        # blockus_data.encode of every game, into out if given
+        if out is None: out = tr.empty(self.num_games, 3, self.size, self.size)
+        planes = out.numpy()
+        planes[:, 1:] = self.cells
+        planes[:, 0] = ~self.cells.any(axis=1)
+        return out
+
+    def to_state(self, game, backend="array"):
+        # the game as a State (or BitboardState), replayed from its actions
+        state = bg.initial_state(self.size, self.polyomino_size, backend=backend)
+        for action in self.plays[game]: state = state.perform(self.table.action(action))
+        return state
+
+def shift_sides(cells):
+    # cells sharing a side with any of the given (..., size, size) cells
+    sides = np.zeros_like(cells)
+    sides[..., :, :-1] |= cells[..., :, 1:]
+    sides[..., :, 1:] |= cells[..., :, :-1]
+    sides[..., :-1, :] |= cells[..., 1:, :]
+    sides[..., 1:, :] |= cells[..., :-1, :]
+    return sides
+
+def shift_corners(cells):
+    corners = np.zeros_like(cells)
+    corners[..., :-1, :-1] |= cells[..., 1:, 1:]
+    corners[..., :-1, 1:] |= cells[..., 1:, :-1]
+    corners[..., 1:, :-1] |= cells[..., :-1, 1:]
+    corners[..., 1:, 1:] |= cells[..., :-1, :-1]
+    return corners
@@ -0,0 +1,55 @@
+"""
+This file is for test blockus_vecenv.py
+"""
+import numpy as np
+import torch as tr
+import unittest as ut
+import blockus_data as bd
+import blockus_vecenv as bv
+
+class BlockusVecEnvTestCase(ut.TestCase):
+
+    def test_matches_states(self):
+        for board_size, polyomino_size in [(3, 3), (6, 5), (8, 4)]:
+            rng = np.random.RandomState(board_size)
+            env = bv.VecEnv(4, board_size, polyomino_size)
+            states = [env.to_state(g, backend="bitboard") for g in range(4)]
+            while not env.done.all():
+                for g, state in enumerate(states):
+                    self.assertTrue(env.done[g] == state.is_leaf())
+                    if env.done[g]: continue
+                    self.assertTrue((env.mask[g] == state.valid_actions(form="mask")).all())
+                    self.assertTrue((env.boards()[g] == state.board).all())
+                    self.assertTrue(env.scores()[g] == state.score_for_max_player())
+                self.assertTrue(tr.equal(env.encode(), bd.encode_batch(states)))
+                actions = env.sample_actions(rng)
+                env.step(actions)
+                states = [state if state.is_leaf() else state.perform(env.table.action(a))
+                    for state, a in zip(states, actions)]
+            for g, state in enumerate(states):
+                self.assertTrue(state.is_leaf())
+                self.assertTrue(str(env.to_state(g)) == str(state))
+
+    def test_reset_and_policy(self):
+        env = bv.VecEnv(3, 5)
+        with self.assertRaises(ValueError): env.step([env.table.pass_id]*3)
+        # logits pick the legal action they favor
+        logits = np.zeros((3, env.num_actions))
+        favorite = np.flatnonzero(env.mask[0])[-1]
+        logits[:, favorite] = 100.
+        self.assertTrue((env.sample_actions(logits=logits) == favorite).all())
+
+        rng = np.random.RandomState(0)
+        while not env.done.any(): env.step(env.sample_actions(rng))
+        done = env.done.copy()
+        env.reset(done)
+        self.assertFalse(env.done.any())
+        self.assertTrue((env.boards()[done] == 0).all())
+        self.assertTrue(all(len(env.plays[g]) == 0 for g in np.flatnonzero(done)))
+
+if __name__ == "__main__":
+
+    test_suite = ut.TestLoader().loadTestsFromTestCase(BlockusVecEnvTestCase)
+    res = ut.TextTestRunner(verbosity=2).run(test_suite)
+    num, errs, fails = res.testsRun, len(res.errors), len(res.failures)
+    print("score: %d of %d (%d errors, %d failures)" % (num - (errs+fails), num, errs, fails))
@@ -0,0 +1,46 @@
+"""
+Zobrist hashing of (board, hands, turn)
+
+A position's key is the XOR of one random 64-bit key per (player, claimed cell),
+per (player, polyomino in hand) and for the player to move. State and
+BitboardState keep their key up to date in perform (State from the first time
+the key is used); zobrist_key computes it from scratch for any state with
+board, hands and turn.
+"""
+import numpy as np
+from polyomino import all_polyominoes
+
+class ZobristKeys(object):
+    def __init__(self, size, num_players=2, seed=0):
+        # fixed seed so keys agree across processes and runs
+        rng = np.random.RandomState(seed + size)
+        def draw(*shape):
+            return rng.randint(0, 2**63, size=shape, dtype=np.int64).tolist()
+        self.size = size
+        self.cells = draw(num_players, size*size)
+        self.pieces = draw(num_players, len(all_polyominoes))
+        self.turns = draw(num_players)
+
+    def placement(self, player, cover):
+        # key of the given player's color on the cells of a bitmask
+        keys, key = self.cells[player-1], 0
+        while cover:
+            low = cover & -cover
+            key ^= keys[low.bit_length() - 1]
+            cover ^= low
+        return key
+
+_keys = {}
+
+def get_keys(size):
+    if size not in _keys: _keys[size] = ZobristKeys(size)
+    return _keys[size]
+
+def zobrist_key(state):
+    keys = get_keys(state.size)
+    key = keys.turns[state.turn-1]
+    for cell, player in enumerate(state.board.flat):
+        if player > 0: key ^= keys.cells[player-1][cell]
+    for player, hand in state.hands.items():
+        for polyomino in hand: key ^= keys.pieces[player-1][polyomino.index]
+    return key
@@ -7,6 +7,8 @@
 // Copyright @ 2020 Chen. All rights reserved. //
 /////////////////////////////////////////////////
 """
+import time
+import itertools as it
 import numpy as np
 
 def uniform(node):
@@ -28,18 +30,49 @@ def puct_probs(node):
     return res
 
 class Node(object):
-    def __init__(self, state, depth = 0, choose_method=uniform):
-        self.state = state
+    def __init__(self, state, depth = 0, choose_method=uniform, transpositions=None,
+        parent_state=None, action=None, key=None, pool=None, parent=None):
+        # a child starts as an edge holding only its action and statistics,
+        # its state is performed from parent_state when first read
+        self._state = state
+        self.parent_state = parent_state
+        self.action = action
         self.child_list = None
         self.visit_count = 0
         self.score_total = 0
         self.depth = depth
         self.choose_method = choose_method
+        # transposition table: dict from state.key to node, shared by the whole
+        # search graph, so children reaching the same position share one node
+        self.transpositions = transpositions
+        self.key = key
+        # node pool of a memory-bounded search, see NodePool; its nodes link to
+        # their parent node instead, so a dropped state can be performed again
+        self.pool = pool
+        self.parent = parent
+    @property
+    def state(self):
+        if self._state is None:
+            if self.parent_state is not None:
+                self._state = self.parent_state.perform(self.action)
+                self.parent_state = None
+            else: self._state = self.parent.state.perform(self.action)
+        return self._state
     def make_child_list(self):
         self.child_list = []
-        for action in self.state.valid_actions():
-            state = self.state.perform(action)
-            node = Node(state, self.depth+1)
+        state = self.state
+        for action in state.valid_actions():
+            if self.pool is not None:
+                node = self.pool.new(self.depth+1, self, action)
+            elif self.transpositions is None:
+                node = Node(None, self.depth+1, parent_state=state, action=action)
+            else:
+                key = state.child_key(action)
+                node = self.transpositions.get(key)
+                if node is None:
+                    node = Node(None, self.depth+1, transpositions=self.transpositions,
+                        parent_state=state, action=action, key=key)
+                    self.transpositions[key] = node
             self.child_list.append(node)
         return self.child_list
     def children(self):
@@ -64,6 +97,52 @@ class Node(object):
     def choose_child(self):
         return self.choose_method(self)
 
+class NodePool(object):
+    # fixed supply of Node objects for a memory-bounded search: children are
+    # taken from the free list, and nodes in pruned subtrees go back to it
+    def __init__(self, capacity):
+        self.free = [Node(None) for _ in range(capacity)]
+        self.live = 0 # nodes in use, counting the root
+        self.peak = 0
+        self.pruned = 0 # subtrees pruned so far
+    def new(self, depth, parent, action):
+        node = self.free.pop() if len(self.free) > 0 else Node(None)
+        node.__init__(None, depth, pool=self, parent=parent, action=action)
+        self.live += 1
+        self.peak = max(self.peak, self.live)
+        return node
+    def release(self, node):
+        # return node's descendants to the free list, keeping node and its statistics
+        stack = list(node.child_list or [])
+        node.child_list = None
+        while len(stack) > 0:
+            n = stack.pop()
+            stack.extend(n.child_list or [])
+            n.__init__(None) # drop references to states and other nodes
+            self.free.append(n)
+            self.live -= 1
+
+def prune(root, pool, max_nodes):
+    # bring the pool under max_nodes: drop the states of expanded nodes below
+    # the root (they are performed again from the root when needed), then
+    # collapse the least visited expanded subtrees; a collapsed node keeps its
+    # own statistics, so the root's children keep theirs
+    expanded, stack = [], [root]
+    while len(stack) > 0:
+        n = stack.pop()
+        if n.child_list is None: continue
+        if n is not root:
+            n._state = None
+            expanded.append(n)
+        stack.extend(n.child_list)
+    # least visited first, deeper first among equals, so subtrees go before their ancestors
+    expanded.sort(key=lambda n: (n.visit_count, -n.depth))
+    for n in expanded:
+        if pool.live <= max_nodes: break
+        if n.child_list is None or n.parent is None: continue # inside a pruned subtree
+        pool.release(n)
+        pool.pruned += 1
+
 def rollout(node, max_depth=None):
     if node.depth == max_depth or node.state.is_leaf():
         result = node.state.score_for_max_player()
@@ -73,10 +152,244 @@ def rollout(node, max_depth=None):
     node.score_total += result
     return result
 
-def decide_action(state, num_rollouts, choose_method=puct, max_depth=10, verbose=False):
-    node = Node(state, choose_method=choose_method)
-    for n in range(num_rollouts):
-        if verbose and n % 10 == 0: print("Rollout %d of %d..." % (n+1, num_rollouts))
-        rollout(node, max_depth=max_depth)
-    return np.argmax(node.get_score_estimates()), node
+def select_leaf(node, max_depth=None, virtual_loss=1):
+    # descend without recursion to a depth cutoff, a terminal state, or a node
+    # that has not been visited yet, adding virtual loss along the way so that
+    # the next selection in the same batch is steered elsewhere
+    path = [node]
+    while True:
+        terminal = node.state.is_leaf()
+        if terminal or node.depth == max_depth: break
+        if node.visit_count == 0 and len(path) > 1: break
+        node = node.choose_child()
+        path.append(node)
+    losses = [0]
+    for parent, child in zip(path[:-1], path[1:]):
+        # a loss from the point of view of the player choosing the child
+        losses.append(-virtual_loss if parent.state.is_max_players_turn() else virtual_loss)
+    for n, loss in zip(path, losses):
+        n.visit_count += 1
+        n.score_total += loss
+    return path, losses, terminal
+
+def batch_rollout(node, evaluate=None, batch_size=1, max_depth=None, virtual_loss=1):
+    # select batch_size leaves, evaluate the non-terminal ones in one call to
+    # evaluate(states) -> scores for the max player, and back up all results;
+    # without evaluate each leaf is played out at random to the max_depth
+    # cutoff, as rollout does below the tree, so batching alone does not
+    # change what the search estimates
+    selected = [select_leaf(node, max_depth, virtual_loss) for _ in range(batch_size)]
+    pending = [path[-1] for path, _, terminal in selected if not terminal]
+    if evaluate is None:
+        values = [random_playout(leaf.state, max_depth=None if max_depth is None else max_depth - leaf.depth)
+            .score_for_max_player() for leaf in pending]
+    else: values = list(evaluate([leaf.state for leaf in pending])) if len(pending) > 0 else []
+    results = []
+    for path, losses, terminal in selected:
+        result = path[-1].state.score_for_max_player() if terminal else values.pop(0)
+        for n, loss in zip(path, losses):
+            n.score_total += result - loss
+        results.append(result)
+    return results
+
+def random_playout(state, rng=np.random, max_depth=None):
+    # play sampled actions (state.sample_action) until both players have had
+    # to pass in a row, or for max_depth turns, without building any nodes;
+    # returns the final state
+    passes, num_players = 0, len(state.plays)
+    for depth in it.count():
+        if passes == num_players or depth == max_depth: break
+        action = state.sample_action(rng)
+        passes = passes + 1 if action is None else 0
+        state = state.perform(action)
+    return state
+
+def random_playouts(states):
+    # evaluate function for batch_rollout with full-depth random playouts
+    return [random_playout(state).score_for_max_player() for state in states]
+
+class Search(object):
+    # anytime search from one root node: run it for a rollout count and/or a
+    # wall-clock budget, in as many slices as needed, and ask for the current
+    # best action at any time (also from another thread while run is going)
+    def __init__(self, node, max_depth=10, batch_size=None, evaluate=None, max_nodes=None):
+        # max_nodes bounds the nodes of a search whose root has a NodePool
+        self.node = node
+        self.max_nodes = max_nodes
+        # depths count from the original root, so cut off relative to this one
+        self.cutoff = None if max_depth is None else node.depth + max_depth
+        self.batch_size = batch_size
+        self.evaluate = evaluate
+        self.rollouts = 0
+        self.elapsed = 0.
+        self.initial_nodes = count_nodes(node)
+        self.stopped = False
+    def step(self, n=1):
+        # n more rollouts, batched if batch_size or evaluate was given
+        if self.batch_size is not None or self.evaluate is not None:
+            batch_rollout(self.node, self.evaluate, n, self.cutoff)
+        else:
+            for _ in range(n): rollout(self.node, max_depth=self.cutoff)
+        pool = self.node.pool
+        if self.max_nodes is not None and pool is not None and pool.live > self.max_nodes:
+            # prune to three quarters of the budget, so pruning is not needed every step
+            prune(self.node, pool, self.max_nodes * 3 // 4)
+        self.rollouts += n
+    def best_action(self, by_visits=False):
+        # child with the best score estimate, or the most visited one
+        if by_visits: return np.argmax(self.node.get_visit_counts())
+        return np.argmax(self.node.get_score_estimates())
+    def decided(self, remaining):
+        # True when the most visited child cannot be overtaken in remaining rollouts,
+        # so best_action(by_visits=True) is settled
+        visits = np.sort(self.node.get_visit_counts())
+        return len(visits) == 1 or visits[-1] - visits[-2] > remaining
+    def stop(self):
+        self.stopped = True
+    def run(self, num_rollouts=None, time_budget=None, early_stop=False, verbose=False):
+        # stop after num_rollouts more rollouts, after time_budget seconds,
+        # when stop() is called, or with early_stop when the decision is settled;
+        # with early_stop the most visited child is returned, the child the
+        # stopping test settles, so stopping early does not change the decision
+        if num_rollouts is None and time_budget is None:
+            raise ValueError("a search needs num_rollouts or time_budget")
+        start, done = time.time(), 0
+        batch_size = 1 if self.batch_size is None else self.batch_size
+        self.stopped = False
+        while not self.stopped:
+            remaining = np.inf if num_rollouts is None else num_rollouts - done
+            elapsed = time.time() - start
+            if time_budget is not None:
+                if elapsed >= time_budget: break
+                # rollouts left in the budget at the rate seen so far
+                if done > 0: remaining = min(remaining, (time_budget - elapsed) * done / elapsed)
+            if remaining <= 0: break
+            if early_stop and done > 0 and self.decided(remaining): break
+            if verbose and done % 10 == 0:
+                print("Rollout %d%s..." % (done+1, "" if num_rollouts is None else " of %d" % num_rollouts))
+            n = int(min(batch_size, num_rollouts - done)) if num_rollouts is not None else batch_size
+            self.step(n)
+            done += n
+        self.elapsed += time.time() - start
+        return self.best_action(by_visits=early_stop)
+    def stats(self):
+        nodes = count_nodes(self.node)
+        stats = search_stats(self.rollouts, self.elapsed, nodes, nodes - self.initial_nodes)
+        if self.node.pool is not None:
+            stats["peak_nodes"] = self.node.pool.peak
+            stats["pruned"] = self.node.pool.pruned
+        return stats
+
+def search_stats(rollouts, elapsed, nodes, new_nodes):
+    # the node.stats of decide_action, for every store and parallel mode
+    return {
+        "rollouts": rollouts,
+        "elapsed": elapsed,
+        "nodes": nodes,
+        "rollouts_per_sec": rollouts / max(elapsed, 1e-9),
+        "nodes_per_sec": new_nodes / max(elapsed, 1e-9),
+    }
+
+def count_nodes(node):
+    # number of distinct nodes reachable from node
+    seen, stack = set(), [node]
+    while len(stack) > 0:
+        n = stack.pop()
+        if id(n) in seen: continue
+        seen.add(id(n))
+        stack.extend(n.child_list or [])
+    return len(seen)
+
+def decide_action(state, num_rollouts, choose_method=puct, max_depth=10, verbose=False,
+    transpositions=False, store="nodes", batch_size=None, evaluate=None,
+    parallel=None, num_workers=None, root=None, time_budget=None, early_stop=False, max_nodes=None,
+    endgame_cells=None, endgame_nodes=10000):
+    # transpositions=True searches a graph where positions reached by
+    # different move orders share one node and its statistics
+    # store="arrays" keeps the tree in numpy arrays, see mcts_arrays
+    # batch_size and/or evaluate switch to batch_rollout: batches of
+    # batch_size leaves (default 1) are evaluated together by evaluate
+    # parallel="root" or "leaf" searches in num_workers processes, see mcts_parallel
+    # root is a node returned by an earlier search and moved along the actions
+    # played since with advance, its subtree and statistics are searched further
+    # time_budget is in seconds, num_rollouts=None then searches until it runs out
+    # early_stop ends the search once the most visited child cannot be overtaken,
+    # and decides on the most visited child rather than the best score estimate
+    # max_nodes bounds the number of nodes in the tree: nodes come from a pool
+    # of that size, and when it runs out states are dropped and the least
+    # visited subtrees are pruned (not with transpositions); the tree can go
+    # over max_nodes by the children expanded within one step, and the
+    # largest size reached is reported as peak_nodes in node.stats
+    # endgame_cells switches to the exact solver in blockus_endgame once at most
+    # that many cells are left to play, unless it needs over endgame_nodes positions
+    # or half the time budget, and then the search gets the rest of the budget
+    # search statistics (see Search.stats) are left in node.stats
+    if num_rollouts is None and time_budget is None:
+        raise ValueError("decide_action needs num_rollouts or time_budget")
+    if early_stop and (parallel is not None or store == "arrays"):
+        raise ValueError("early_stop needs store='nodes' and no parallel")
+    if endgame_cells is not None:
+        import blockus_endgame
+        if blockus_endgame.playable_cells(state) <= endgame_cells:
+            start = time.time()
+            time_limit = None if time_budget is None else time_budget / 2
+            result = blockus_endgame.decide_action(state, choose_method, endgame_nodes, time_limit)
+            if result is not None:
+                if verbose: print("Solved endgame in %d positions" % result[1].stats["nodes"])
+                return result
+            if time_budget is not None: time_budget -= time.time() - start
+    if parallel is not None:
+        import mcts_parallel
+        return mcts_parallel.decide_action(state, num_rollouts, choose_method, max_depth, verbose,
+            parallel=parallel, num_workers=num_workers, time_budget=time_budget)
+    if store == "arrays":
+        import mcts_arrays
+        return mcts_arrays.decide_action(state, num_rollouts, choose_method, max_depth, verbose, time_budget)
+    if root is not None and root.state.key == state.key:
+        node = root
+        node.choose_method = choose_method
+        if node.pool is not None and node.parent is not None:
+            # let go of the tree above the new root
+            node.parent = None
+            node.pool.live = count_nodes(node)
+    elif transpositions:
+        node = Node(state, choose_method=choose_method, transpositions={}, key=state.key)
+        node.transpositions[node.key] = node
+    elif max_nodes is not None:
+        pool = NodePool(max_nodes)
+        node = Node(state, choose_method=choose_method, pool=pool)
+        pool.live = pool.peak = 1
+    else:
+        node = Node(state, choose_method=choose_method)
+    search = Search(node, max_depth, batch_size, evaluate, max_nodes)
+    a = search.run(num_rollouts, time_budget, early_stop, verbose)
+    node.stats = search.stats()
+    return a, node
+
+def advance(node, action):
+    # the child of node reached by action, to pass as root to the next search,
+    # or None when that child is not in the tree; the rest of the tree is
+    # dropped once the caller lets go of node
+    if node is None or node.child_list is None: return None
+    actions = node.state.valid_actions()
+    if action not in actions: return None
+    child = node.child_list[actions.index(action)]
+    if child.pool is not None:
+        # detach from the old tree, which goes back to the pool
+        child.state
+        child.parent = None
+        node.child_list.remove(child)
+        child.pool.release(node)
+        child.pool.live = count_nodes(child)
+    if child.transpositions is not None:
+        # keep only the table entries still reachable from the new root
+        reachable, stack = {}, [child]
+        while len(stack) > 0:
+            n = stack.pop()
+            if n.key in reachable: continue
+            reachable[n.key] = n
+            stack.extend(n.child_list or [])
+        child.transpositions.clear()
+        child.transpositions.update(reachable)
+    return child
 
@@ -0,0 +1,149 @@
+"""
+Struct-of-arrays search tree for mcts.decide_action
+
+Node statistics live in preallocated numpy arrays that grow by doubling, and
+the children of a node occupy one contiguous block of indices, so selection,
+backup and root statistics work on array slices instead of Python lists.
+Node 0 is the root. As in mcts.Node, only the root uses the given choose
+method, and deeper nodes choose uniformly.
+"""
+import time
+import numpy as np
+import mcts
+
+class ArrayTree(object):
+    def __init__(self, state, capacity=1024):
+        self.size = 0
+        self.visit_count = np.zeros(capacity, dtype=np.int64)
+        self.score_total = np.zeros(capacity, dtype=np.float64)
+        self.first_child = np.full(capacity, -1, dtype=np.int64) # -1 until expanded
+        self.num_children = np.zeros(capacity, dtype=np.int64)
+        self.parent = np.full(capacity, -1, dtype=np.int64)
+        self.action = np.full(capacity, -1, dtype=np.int64) # index into parent's valid_actions
+        self.depth = np.zeros(capacity, dtype=np.int64)
+        self.states = [] # built the first time a node is reached
+        self.allocate(1)
+        self.states[0] = state
+
+    def allocate(self, n):
+        # reserve n consecutive node indices, growing the arrays if needed
+        start = self.size
+        if start + n > len(self.visit_count):
+            capacity = max(2*len(self.visit_count), start + n)
+            for name, fill in [("visit_count", 0), ("score_total", 0), ("first_child", -1),
+                ("num_children", 0), ("parent", -1), ("action", -1), ("depth", 0)]:
+                old = getattr(self, name)
+                new = np.full(capacity, fill, dtype=old.dtype)
+                new[:start] = old[:start]
+                setattr(self, name, new)
+        self.size += n
+        self.states.extend([None]*n)
+        return start
+
+    def state(self, i):
+        if self.states[i] is None:
+            parent = self.parent[i]
+            action = self.state(parent).valid_actions()[self.action[i]]
+            self.states[i] = self.states[parent].perform(action)
+        return self.states[i]
+
+    def children(self, i):
+        # index range of node i's children, expanding it on first use
+        if self.first_child[i] < 0:
+            n = len(self.state(i).valid_actions())
+            start = self.allocate(n)
+            self.first_child[i] = start
+            self.num_children[i] = n
+            self.parent[start:start+n] = i
+            self.action[start:start+n] = np.arange(n)
+            self.depth[start:start+n] = self.depth[i] + 1
+        start = self.first_child[i]
+        return start, start + self.num_children[i]
+
+    def get_visit_counts(self, i):
+        start, end = self.children(i)
+        return self.visit_count[start:end]
+
+    def get_score_estimates(self, i):
+        start, end = self.children(i)
+        n, w = self.visit_count[start:end], self.score_total[start:end]
+        q = np.where(n > 0, w / np.maximum(n, 1), 0.)
+        if not self.state(i).is_max_players_turn(): q = -q
+        return q
+
+def uniform(tree, i):
+    return np.random.choice(tree.num_children[i])
+
+def puct(tree, i):
+    return np.random.choice(tree.num_children[i], p=puct_probs(tree, i))
+
+def puct_probs(tree, i):
+    # vectorized mcts.puct_probs
+    n = tree.get_visit_counts(i)
+    q = tree.get_score_estimates(i)
+    res = q + np.sqrt(np.log(tree.visit_count[i] + 1) / (n + 1))
+    res = np.exp(res)
+    return res / res.sum()
+
+class ArrayNode(object):
+    # mcts.Node-like view of one tree node, for the decide_action return value
+    # and for choose methods written against mcts.Node
+    def __init__(self, tree, index):
+        self.tree = tree
+        self.index = index
+    @property
+    def state(self):
+        return self.tree.state(self.index)
+    @property
+    def visit_count(self):
+        return self.tree.visit_count[self.index]
+    @property
+    def score_total(self):
+        return self.tree.score_total[self.index]
+    @property
+    def depth(self):
+        return self.tree.depth[self.index]
+    def children(self):
+        start, end = self.tree.children(self.index)
+        return [ArrayNode(self.tree, c) for c in range(start, end)]
+    def get_score_estimates(self):
+        return self.tree.get_score_estimates(self.index)
+    def get_visit_counts(self):
+        return self.tree.get_visit_counts(self.index)
+
+def array_choose_method(choose_method):
+    # array versions of the mcts choose methods, other methods get node views
+    if choose_method is mcts.puct: return puct
+    if choose_method is mcts.uniform: return uniform
+    def choose(tree, i):
+        return choose_method(ArrayNode(tree, i)).index - tree.first_child[i]
+    return choose
+
+def rollout(tree, root_choose, max_depth=None):
+    # one playout from the root, without recursion
+    path, i = [0], 0
+    choose = root_choose
+    while tree.depth[i] != max_depth and not tree.state(i).is_leaf():
+        start, _ = tree.children(i)
+        i = start + choose(tree, i)
+        path.append(i)
+        choose = uniform
+    result = tree.state(i).score_for_max_player()
+    tree.visit_count[path] += 1
+    tree.score_total[path] += result
+    return result
+
+def decide_action(state, num_rollouts, choose_method=mcts.puct, max_depth=10, verbose=False,
+    time_budget=None):
+    # num_rollouts and/or time_budget (seconds) as in mcts.decide_action
+    tree = ArrayTree(state)
+    root_choose = array_choose_method(choose_method)
+    start, n = time.time(), 0
+    while num_rollouts is None or n < num_rollouts:
+        if time_budget is not None and time.time() - start >= time_budget: break
+        if verbose and n % 10 == 0: print("Rollout %d..." % (n+1))
+        rollout(tree, root_choose, max_depth=max_depth)
+        n += 1
+    node = ArrayNode(tree, 0)
+    node.stats = mcts.search_stats(n, time.time() - start, tree.size, tree.size - 1)
+    return np.argmax(tree.get_score_estimates(0)), node
@@ -0,0 +1,100 @@
+"""
+Root-parallel and leaf-parallel MCTS over a persistent process pool
+
+Root parallelism: each worker searches its own tree from the same state with
+its own seed, and the root children's visit counts and score totals are summed.
+Leaf parallelism: the main process selects a batch of leaves with virtual loss
+(mcts.batch_rollout) and the workers play each leaf out at random.
+The pool is created on first use and reused across calls. States travel to the
+workers in their pickled form, which for BitboardState is a handful of ints.
+"""
+import time
+import multiprocessing as mp
+import numpy as np
+import mcts
+
+_pool, _pool_size = None, None
+
+def get_pool(num_workers=None):
+    # reuse the worker pool across moves, only restarting it to resize
+    global _pool, _pool_size
+    if num_workers is None: num_workers = mp.cpu_count()
+    if _pool is None or _pool_size != num_workers:
+        close_pool()
+        _pool, _pool_size = mp.Pool(num_workers), num_workers
+    return _pool
+
+def close_pool():
+    global _pool, _pool_size
+    if _pool is not None:
+        _pool.close()
+        _pool.join()
+    _pool, _pool_size = None, None
+
+def search(args):
+    # worker: independent search, returns root children statistics and tree size
+    state, num_rollouts, choose_method, max_depth, seed, time_budget = args
+    np.random.seed(seed)
+    _, node = mcts.decide_action(state, num_rollouts, choose_method, max_depth, time_budget=time_budget)
+    children = node.children()
+    return (
+        np.array([child.visit_count for child in children]),
+        np.array([child.score_total for child in children], dtype=float),
+        node.stats["nodes"])
+
+def playout(args):
+    # worker: random moves from state for at most max_depth turns
+    state, max_depth, seed = args
+    rng = np.random.RandomState(seed)
+    return mcts.random_playout(state, rng, max_depth).score_for_max_player()
+
+def merge(state, choose_method, visit_counts, score_totals):
+    # node whose children carry the summed worker statistics
+    node = mcts.Node(state, choose_method=choose_method)
+    for c, child in enumerate(node.children()):
+        child.visit_count = int(visit_counts[c])
+        child.score_total = score_totals[c]
+    node.visit_count = int(np.sum(visit_counts))
+    node.score_total = np.sum(score_totals)
+    return node
+
+def decide_action(state, num_rollouts, choose_method=mcts.puct, max_depth=10, verbose=False,
+    parallel="root", num_workers=None, playout_depth=None, time_budget=None):
+    # parallel="root": every worker runs num_rollouts from its own tree
+    # parallel="leaf": num_rollouts in batches of num_workers leaves, each
+    #   played out at random for playout_depth turns, or to the end of the
+    #   game when playout_depth is None
+    # num_rollouts and/or time_budget (seconds) as in mcts.decide_action
+    # returns (action_index, node) like mcts.decide_action, statistics merged on node
+    if num_rollouts is None and time_budget is None:
+        raise ValueError("decide_action needs num_rollouts or time_budget")
+    pool = get_pool(num_workers)
+    seeds = np.random.randint(2**31, size=_pool_size)
+    start = time.time()
+
+    if parallel == "root":
+        if verbose: print("Searching in %d workers..." % _pool_size)
+        results = pool.map(search, [
+            (state, num_rollouts, choose_method, max_depth, seed, time_budget) for seed in seeds])
+        visit_counts = sum(n for n, _, _ in results)
+        score_totals = sum(w for _, w, _ in results)
+        node = merge(state, choose_method, visit_counts, score_totals)
+        nodes = sum(size for _, _, size in results)
+
+    elif parallel == "leaf":
+        def evaluate(states):
+            seeds = np.random.randint(2**31, size=len(states))
+            return pool.map(playout, [(s, playout_depth, seed) for s, seed in zip(states, seeds)])
+        node, n = mcts.Node(state, choose_method=choose_method), 0
+        while num_rollouts is None or n < num_rollouts:
+            if time_budget is not None and time.time() - start >= time_budget: break
+            if verbose: print("Rollout %d..." % (n+1))
+            batch = _pool_size if num_rollouts is None else min(_pool_size, num_rollouts - n)
+            mcts.batch_rollout(node, evaluate, batch, max_depth)
+            n += batch
+        nodes = mcts.count_nodes(node)
+
+    else: raise ValueError("parallel must be 'root' or 'leaf', not %r" % (parallel,))
+
+    node.stats = mcts.search_stats(node.visit_count, time.time() - start, nodes, nodes - 1)
+    return np.argmax(node.get_score_estimates()), node
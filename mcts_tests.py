@@ -5,6 +5,9 @@ import numpy as np
 import torch as tr
 import unittest as ut
 import mcts as ms
+import mcts_arrays as ma
+import mcts_parallel as mp
+import blockus_zobrist as bz
 import blockus_game as bg
 
 class TestState(object):
@@ -62,6 +65,217 @@ class MCTSTestCase(ut.TestCase):
             child.children()
             self.assertTrue(len(child.child_list) == Ngc)
 
+    def test_lazy_children(self):
+        state = bg.initial_state(board_size=6, polyomino_size=3, backend="bitboard")
+        node = ms.Node(state)
+        children = node.children()
+        self.assertTrue(all(child._state is None for child in children))
+        self.assertTrue([child.action for child in children] == state.valid_actions())
+        child = children[2]
+        self.assertTrue(child.state.key == state.perform(state.valid_actions()[2]).key)
+        self.assertTrue(child.state is child.state)
+        self.assertTrue(child.parent_state is None)
+        self.assertTrue(sum(c._state is not None for c in children) == 1)
+
+    def test_transpositions(self):
+        for backend in ["array", "bitboard"]:
+            state = bg.initial_state(board_size=6, backend=backend)
+            mono, domino, corner = state.hands[1][0], state.hands[1][1], state.hands[1][3]
+            # same position after player 1's second and third pieces swap order
+            paths = [
+                [(corner, 0, 0, 0), (mono, 0, 5, 5), (mono, 0, 1, 2), (domino, 1, 3, 4), (domino, 1, 2, 1)],
+                [(corner, 0, 0, 0), (mono, 0, 5, 5), (domino, 1, 2, 1), (domino, 1, 3, 4), (mono, 0, 1, 2)],
+            ]
+            for transpositions in [None, {}]:
+                root = ms.Node(state, transpositions=transpositions)
+                leaves = []
+                for path in paths:
+                    node = root
+                    for action in path:
+                        node = node.children()[node.state.valid_actions().index(action)]
+                    leaves.append(node)
+                self.assertTrue((leaves[0] is leaves[1]) == (transpositions is not None))
+
+    def test_child_key(self):
+        # keys updated in perform and child_key match keys computed from scratch
+        rng = np.random.RandomState(0)
+        for backend in ["array", "bitboard"]:
+            state = bg.initial_state(board_size=5, polyomino_size=3, backend=backend)
+            state.key
+            while not state.is_leaf():
+                for action in state.valid_actions():
+                    self.assertTrue(state.child_key(action) == bz.zobrist_key(state.perform(action)))
+                state = state.perform(state.sample_action(rng))
+                self.assertTrue(state.key == bz.zobrist_key(state))
+
+    def test_array_store(self):
+        state = bg.initial_state(board_size=5, polyomino_size=3)
+        for choose_method in [ms.uniform, ms.puct]:
+            results = []
+            for store in ["nodes", "arrays"]:
+                np.random.seed(0)
+                a, node = ms.decide_action(state, 30, choose_method, max_depth=4, store=store)
+                results.append((a, node.get_visit_counts(), node.get_score_estimates(),
+                    [child.state.key for child in node.children()]))
+            self.assertTrue(results[0][0] == results[1][0])
+            self.assertTrue(np.allclose(results[0][1], results[1][1]))
+            self.assertTrue(np.allclose(results[0][2], results[1][2]))
+            self.assertTrue(results[0][3] == results[1][3])
+
+        tree = ma.ArrayTree(state, capacity=2)
+        start, end = tree.children(0)
+        self.assertTrue((start, end) == (1, 1 + len(state.valid_actions())))
+        self.assertTrue((tree.parent[start:end] == 0).all())
+        self.assertTrue((tree.depth[start:end] == 1).all())
+
+    def test_batch_rollout(self):
+        state = bg.initial_state(board_size=5, polyomino_size=3, backend="bitboard")
+        batches = []
+        def evaluate(states):
+            batches.append(len(states))
+            return [1.] * len(states)
+        a, node = ms.decide_action(state, 20, max_depth=3, batch_size=8, evaluate=evaluate)
+        self.assertTrue(sum(batches) <= 20 and max(batches) <= 8 and len(batches) == 3)
+        # virtual losses are all removed again
+        self.assertTrue(node.visit_count == 20)
+        self.assertTrue(node.visit_count == node.get_visit_counts().sum())
+        self.assertTrue(node.score_total == 20)
+        self.assertTrue(all(child.score_total == child.visit_count for child in node.children()))
+        self.assertTrue(0 <= a < len(node.children()))
+
+        # without evaluate, leaves are played out to the depth cutoff
+        depths, random_playout = [], ms.random_playout
+        def playout(state, rng=np.random, max_depth=None):
+            depths.append(max_depth)
+            return random_playout(state, rng, max_depth)
+        ms.random_playout = playout
+        try: a, node = ms.decide_action(state, 20, max_depth=4, batch_size=4)
+        finally: ms.random_playout = random_playout
+        self.assertTrue(len(depths) > 0 and all(0 <= d <= 3 for d in depths) and max(depths) == 3)
+        self.assertTrue(node.visit_count == 20)
+
+        # terminal leaves are scored without calling evaluate
+        path, losses, terminal = ms.select_leaf(ms.Node(bg.initial_state(board_size=1, polyomino_size=1)))
+        self.assertTrue(path[-1].state.is_leaf() == terminal)
+
+    def test_parallel(self):
+        state = bg.initial_state(board_size=5, polyomino_size=3, backend="bitboard")
+        try:
+            pool = mp.get_pool(2)
+            a, node = ms.decide_action(state, 10, max_depth=3, parallel="root", num_workers=2)
+            self.assertTrue(node.visit_count == 2*10)
+            self.assertTrue(node.get_visit_counts().sum() == 2*10)
+            self.assertTrue(a == np.argmax(node.get_score_estimates()))
+
+            # workers are reused across calls
+            a, node = ms.decide_action(state, 10, max_depth=3, parallel="leaf", num_workers=2)
+            self.assertTrue(mp.get_pool(2) is pool)
+            self.assertTrue(node.visit_count == 10)
+            self.assertTrue(node.get_visit_counts().sum() == 10)
+            self.assertTrue(node.children()[a].state.key == state.perform(state.valid_actions()[a]).key)
+            self.assertTrue(node.stats["rollouts"] == 10)
+
+            # time budgets, in the workers or between batches
+            for parallel in ["root", "leaf"]:
+                a, node = ms.decide_action(state, None, max_depth=3, parallel=parallel,
+                    num_workers=2, time_budget=0.3)
+                self.assertTrue(node.stats["rollouts"] == node.visit_count > 0)
+                self.assertTrue(node.stats["elapsed"] < 2.)
+            with self.assertRaises(ValueError): ms.decide_action(state, None, parallel="root", num_workers=2)
+        finally:
+            mp.close_pool()
+
+    def test_advance(self):
+        state = bg.initial_state(board_size=5, polyomino_size=3, backend="bitboard")
+        for transpositions in [False, True]:
+            a, node = ms.decide_action(state, 60, max_depth=4, transpositions=transpositions)
+            child = ms.advance(node, state.valid_actions()[a])
+            self.assertTrue(child is node.children()[a])
+            state1 = state.perform(state.valid_actions()[a])
+            reply = np.argmax(child.get_visit_counts())
+            grandchild = ms.advance(child, state1.valid_actions()[reply])
+            visits = grandchild.visit_count
+            self.assertTrue(visits > 0)
+            if transpositions:
+                self.assertTrue(grandchild.key in grandchild.transpositions)
+                self.assertTrue(node.key not in grandchild.transpositions)
+
+            # search continues in the subtree with its statistics intact
+            state2 = state1.perform(state1.valid_actions()[reply])
+            _, reused = ms.decide_action(state2, 20, max_depth=4, root=grandchild)
+            self.assertTrue(reused is grandchild)
+            self.assertTrue(reused.visit_count == visits + 20)
+
+            # unknown positions and unexpanded nodes start a fresh search
+            self.assertTrue(ms.advance(None, None) is None)
+            self.assertTrue(ms.advance(ms.Node(state), state.valid_actions()[0]) is None)
+            _, fresh = ms.decide_action(state, 5, max_depth=4, root=grandchild)
+            self.assertTrue(fresh is not grandchild and fresh.visit_count == 5)
+
+    def test_time_budget(self):
+        state = bg.initial_state(board_size=5, polyomino_size=3, backend="bitboard")
+        a, node = ms.decide_action(state, None, max_depth=4, time_budget=0.2)
+        self.assertTrue(node.stats["rollouts"] == node.visit_count > 0)
+        self.assertTrue(0.2 <= node.stats["elapsed"] < 1.)
+        self.assertTrue(node.stats["nodes"] == ms.count_nodes(node))
+        self.assertTrue(node.stats["rollouts_per_sec"] > 0)
+
+        # with no limit at all, and the same for the array store
+        for store in ["nodes", "arrays"]:
+            with self.assertRaises(ValueError): ms.decide_action(state, None, store=store)
+        with self.assertRaises(ValueError): ms.decide_action(state, 10, store="arrays", early_stop=True)
+        a, node = ms.decide_action(state, None, max_depth=4, time_budget=0.2, store="arrays")
+        self.assertTrue(node.stats["rollouts"] == node.visit_count > 0)
+        self.assertTrue(0.2 <= node.stats["elapsed"] < 1. and node.stats["nodes"] == node.tree.size)
+
+        # rollout cap reached before the budget
+        a, node = ms.decide_action(state, 7, max_depth=4, time_budget=10.)
+        self.assertTrue(node.stats["rollouts"] == 7 and node.stats["elapsed"] < 10.)
+
+        # early stop once the visit lead cannot be overtaken
+        a, node = ms.decide_action(state, 20, choose_method=lambda node: node.children()[0],
+            max_depth=4, early_stop=True)
+        self.assertTrue(node.stats["rollouts"] == 11)
+
+        # and decides on the child it settled, the same one as with the full cap
+        for seed in range(5):
+            np.random.seed(seed)
+            a, node = ms.decide_action(state, 30, max_depth=4, early_stop=True)
+            self.assertTrue(a == np.argmax(node.get_visit_counts()))
+            np.random.seed(seed)
+            search = ms.Search(ms.Node(state, choose_method=ms.puct), max_depth=4)
+            search.run(num_rollouts=30)
+            if node.stats["rollouts"] < 30: self.assertTrue(a == search.best_action(by_visits=True))
+
+    def test_search(self):
+        parent = make_nodes(True, 10, 0, [False, False, False], [6, 3, 1], [1, 4, 0])
+        search = ms.Search(parent)
+        self.assertTrue(search.decided(2))
+        self.assertFalse(search.decided(3))
+        self.assertTrue(search.best_action() == 1)
+        self.assertTrue(search.best_action(by_visits=True) == 0)
+
+        node = ms.Node(bg.initial_state(board_size=5, polyomino_size=3, backend="bitboard"))
+        search = ms.Search(node, max_depth=4)
+        search.run(num_rollouts=5)
+        search.run(num_rollouts=5)
+        self.assertTrue(search.rollouts == node.visit_count == 10)
+        self.assertTrue(search.best_action() == np.argmax(node.get_score_estimates()))
+
+    def test_random_playout(self):
+        rng = np.random.RandomState(0)
+        for backend in ["array", "bitboard"]:
+            state = bg.initial_state(board_size=5, polyomino_size=3, backend=backend)
+            final = ms.random_playout(state, rng)
+            self.assertTrue(final.is_leaf())
+            partial = ms.random_playout(state, rng, max_depth=3)
+            self.assertTrue(sum(map(len, partial.plays.values())) == 3)
+
+        # full-depth playouts as leaf evaluation
+        state = bg.initial_state(board_size=5, polyomino_size=3, backend="bitboard")
+        a, node = ms.decide_action(state, 20, max_depth=None, evaluate=ms.random_playouts)
+        self.assertTrue(node.visit_count == 20 and 0 <= a < len(node.children()))
+
     def test_puct_probs(self):
 
         parent = make_nodes(True, 10, 0, [False, False], [3, 7], [1, 4])
@@ -75,7 +289,41 @@ class MCTSTestCase(ut.TestCase):
         parent = make_nodes(False, 3, 0, [True, True], [3, 0], [2, 0])
         probs = ms.puct_probs(parent)
         self.assertTrue(np.allclose(probs, np.array([0.22177166, 0.77822834])))
+
+    def test_array_puct_probs(self):
+        for Mp, Np, N, W in [(True, 10, [3, 7], [1, 4]), (False, 3, [3, 0], [2, 0])]:
+            tree = ma.ArrayTree(make_state(Mp))
+            tree.allocate(2)
+            tree.first_child[0], tree.num_children[0] = 1, 2
+            tree.visit_count[:3] = [Np] + N
+            tree.score_total[:3] = [0] + W
+            self.assertTrue(np.allclose(ma.puct_probs(tree, 0), ms.puct_probs(make_nodes(Mp, Np, 0, [not Mp]*2, N, W))))
         
+    def test_max_nodes(self):
+        state = bg.initial_state(board_size=8, backend="bitboard")
+        np.random.seed(0)
+        a, node = ms.decide_action(state, 300, max_depth=6)
+        np.random.seed(0)
+        bounded_a, bounded = ms.decide_action(state, 300, max_depth=6, max_nodes=2000)
+        # pruning keeps the root's statistics, so the same move is chosen
+        self.assertTrue(bounded_a == a)
+        self.assertTrue((bounded.get_visit_counts() == node.get_visit_counts()).all())
+        self.assertTrue(np.allclose(bounded.get_score_estimates(), node.get_score_estimates()))
+        self.assertTrue(ms.count_nodes(node) > 2000)
+        self.assertTrue(bounded.stats["pruned"] > 0)
+        self.assertTrue(bounded.stats["nodes"] <= bounded.stats["peak_nodes"])
+        self.assertTrue(bounded.pool.live == ms.count_nodes(bounded))
+
+        # states of pruned or dropped nodes are performed again from the root
+        child = max(bounded.children(), key=lambda c: c.visit_count)
+        self.assertTrue(str(child.state) == str(state.perform(child.action)))
+
+        # a reused root lets go of the tree above it
+        child = ms.advance(bounded, bounded.state.valid_actions()[bounded_a])
+        self.assertTrue(child.parent is None and child.pool.live == ms.count_nodes(child))
+        _, again = ms.decide_action(child.state, 50, max_depth=6, root=child, max_nodes=2000)
+        self.assertTrue(again is child)
+
 if __name__ == "__main__":    
     
     test_suite = ut.TestLoader().loadTestsFromTestCase(MCTSTestCase)
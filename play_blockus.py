@@ -1,6 +1,7 @@
 import itertools as it
 import numpy as np
 import blockus_game as bg
+from blockus_placements import get_table
 
 def get_int(prompt, low, high):
     valid = list(map(str, range(low,high)))
@@ -62,8 +63,10 @@ if __name__ == "__main__":
             chars = np.array([bg.OPEN, bg.RED, bg.BLUE])
             valid_board = np.repeat(chars[state.board], 2, axis=1)
             valid_positions = []
+            valid_mask = state.valid_actions(form="mask")
+            table = get_table(state.size)
             for (row, col) in it.product(range(state.size), repeat=2):
-                if (polyomino, pose, row, col) in valid_actions:
+                if valid_mask[table.ids.get((polyomino.index, pose, row, col), table.pass_id)]:
                     valid_positions.append((row, col))
                     num = "%2d" % (len(valid_positions)-1)
                     valid_board[row,2*col:2*col+2] = list(num)
@@ -1,6 +1,7 @@
 import itertools as it
 import numpy as np
 import blockus_game as bg
+from blockus_placements import get_table
 import mcts as mcts
 
 def get_int(prompt, low, high):
@@ -12,7 +13,8 @@ def get_int(prompt, low, high):
 
 if __name__ == "__main__":
     
-    state = bg.initial_state(board_size = 6)
+    state = bg.initial_state(board_size = 6, backend = "bitboard")
+    root = None # search tree kept between moves
     for step in it.count():
         print(state)
         print("Step %d" % step)
@@ -24,12 +26,16 @@ if __name__ == "__main__":
         valid_actions = state.valid_actions()
         if len(valid_actions) == 1:
             state = state.perform(valid_actions[0])
+            root = mcts.advance(root, valid_actions[0])
             continue
 
         # Otherwise, if it is the AI's turn (min), run MCTS to decide its action
         if not state.is_max_players_turn():
-            a, node = mcts.decide_action(state, num_rollouts=100, max_depth = 10, verbose=True)
-            state = node.children()[a].state
+            a, node = mcts.decide_action(state, num_rollouts=100, time_budget=5, early_stop=True,
+                max_depth = 10, verbose=True, root=root, endgame_cells=20)
+            root = node.children()[a]
+            node = None # only root's subtree is kept for the next search
+            state = root.state
             continue
 
         # Otherwise, get next move from user
@@ -69,8 +75,10 @@ if __name__ == "__main__":
             chars = np.array([bg.OPEN, bg.RED, bg.BLUE])
             valid_board = np.repeat(chars[state.board], 2, axis=1)
             valid_positions = []
+            valid_mask = state.valid_actions(form="mask")
+            table = get_table(state.size)
             for (row, col) in it.product(range(state.size), repeat=2):
-                if (polyomino, pose, row, col) in valid_actions:
+                if valid_mask[table.ids.get((polyomino.index, pose, row, col), table.pass_id)]:
                     valid_positions.append((row, col))
                     num = "%2d" % (len(valid_positions)-1)
                     valid_board[row,2*col:2*col+2] = list(num)
@@ -85,6 +93,7 @@ if __name__ == "__main__":
         # perform selected action
         action = polyomino, pose, row, col
         state = state.perform(action)
+        root = mcts.advance(root, action)
 
     print("Game over!")
     
@@ -2,9 +2,10 @@ import itertools as it
 import numpy as np
 import torch as tr
 import blockus_game as bg
+from blockus_placements import get_table
 import mcts as mcts
-import blockus_data as bd
 import blockus_net as bn
+import blockus_evaluator as be
 
 def get_int(prompt, low, high):
     valid = list(map(str, range(low,high)))
@@ -16,18 +17,24 @@ def get_int(prompt, low, high):
 board_size = 6
 net = bn.BlockusNet1(board_size)
 net.load_state_dict(tr.load("model%d.pth" % board_size))
+evaluator = be.CachedEvaluator(net) # shared by every search in this game
 
 def nn_puct(node):
-    with tr.no_grad():
-        x = tr.stack(tuple(map(bd.encode, [child.state for child in node.children()])))
-        y = net(x)
-        probs = tr.softmax(y.flatten(), dim=0)
-        a = np.random.choice(len(probs), p=probs.detach().numpy())
+    y = tr.tensor(evaluator([child.state for child in node.children()]))
+    probs = tr.softmax(y, dim=0)
+    a = np.random.choice(len(probs), p=probs.numpy())
     return node.children()[a]
 
+def nn_evaluate(states):
+    # batched leaf evaluation for mcts.batch_rollout
+    # the net scores a state for the player who just moved into it
+    y = evaluator(states)
+    return np.where([not state.is_max_players_turn() for state in states], y, -y)
+
 if __name__ == "__main__":
     
-    state = bg.initial_state(board_size = 6)
+    state = bg.initial_state(board_size = 6, backend = "bitboard")
+    root = None # search tree kept between moves
     for step in it.count():
         print(state)
         print("Step %d" % step)
@@ -39,14 +46,20 @@ if __name__ == "__main__":
         valid_actions = state.valid_actions()
         if len(valid_actions) == 1:
             state = state.perform(valid_actions[0])
+            root = mcts.advance(root, valid_actions[0])
             continue
 
         # Otherwise, if it is the AI's turn (min), run MCTS to decide its action
         if not state.is_max_players_turn():
             a, node = mcts.decide_action(state,
-                choose_method=nn_puct,
-                num_rollouts=100, max_depth = 10, verbose=True)
-            state = node.children()[a].state
+                evaluate=nn_evaluate, batch_size=8,
+                num_rollouts=100, time_budget=5, early_stop=True,
+                max_depth = 10, verbose=True, root=root, endgame_cells=20)
+            root = node.children()[a]
+            node = None # only root's subtree is kept for the next search
+            state = root.state
+            print("Evaluation cache: %d hits, %d misses (%.0f%%)" % (
+                evaluator.hits, evaluator.misses, 100*evaluator.hit_rate()))
             continue
 
         # Otherwise, get next move from user
@@ -86,8 +99,10 @@ if __name__ == "__main__":
             chars = np.array([bg.OPEN, bg.RED, bg.BLUE])
             valid_board = np.repeat(chars[state.board], 2, axis=1)
             valid_positions = []
+            valid_mask = state.valid_actions(form="mask")
+            table = get_table(state.size)
             for (row, col) in it.product(range(state.size), repeat=2):
-                if (polyomino, pose, row, col) in valid_actions:
+                if valid_mask[table.ids.get((polyomino.index, pose, row, col), table.pass_id)]:
                     valid_positions.append((row, col))
                     num = "%2d" % (len(valid_positions)-1)
                     valid_board[row,2*col:2*col+2] = list(num)
@@ -102,6 +117,7 @@ if __name__ == "__main__":
         # perform selected action
         action = polyomino, pose, row, col
         state = state.perform(action)
+        root = mcts.advance(root, action)
 
     print("Game over!")
     
@@ -68,6 +68,10 @@ polyominoes = [
     ],
 ]
 
+# flat list of all polyominoes, each polyomino knows its index in it
+all_polyominoes = [polyomino for group in polyominoes for polyomino in group]
+for index, polyomino in enumerate(all_polyominoes): polyomino.index = index
+
 if __name__ == "__main__":
     
     print(polyominoes[2][0].array)